@@ -0,0 +1,141 @@
+"""
+Benchmark of the scripts/main.py onboarding flow against local stand-ins:
+in-process EFS / Secrets Manager fakes (benchmarks/fakes.py), a local Postgres and a
+temporary directory in place of /mnt.
+
+    python3 benchmarks/bench_onboarding.py                    # 1, 10 and 100 tenants
+    python3 benchmarks/bench_onboarding.py --tenants 10 --api-latency 0.05 --create-delay 5
+    python3 benchmarks/bench_onboarding.py --fake-postgres    # no local Postgres needed
+    python3 benchmarks/bench_onboarding.py --warm-pool 10     # claim file systems from a pre-filled warm pool
+
+The local Postgres is configured with the usual PGHOST / PGPORT / PGUSER / PGPASSWORD variables,
+e.g. docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:15
+"""
+import argparse
+import getpass
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'scripts'))
+sys.path.insert(0, BENCH_DIR)
+
+REGION = 'ca-central-1'
+MASTER_SECRET = 'master_password'
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def setup_environment(mount_root, warm_pool_size=0):
+    """ Module level settings have to be in place before the onboarding modules are imported. """
+    os.environ['AWS_REGION'] = REGION
+    os.environ['EFS_WARM_POOL_SIZE'] = str(warm_pool_size)
+    os.environ['ONBOARDING_MOUNT_ROOT'] = mount_root
+    os.environ['EFS_OWNER'] = getpass.getuser()
+    os.makedirs(os.path.join(mount_root, 'glowroot', 'lib'))
+    for i in range(50):
+        with open(os.path.join(mount_root, 'glowroot', 'lib', f"plugin-{i}.jar"), 'wb') as file:
+            file.write(os.urandom(16 * 1024))
+
+
+def run_benchmark(tenants, envs, args, mount_root, run_id):
+    import main
+    import rds
+    from efs import AwsEfsManager
+    from fakes import FakeEfsClient, FakeSecretsClient, FakePostgresProvisioner
+    from postgres import PostgresProvisioner
+    from secrets import CachedSecretManager
+    from telemetry import tracer
+
+    class LocalEfsManager(AwsEfsManager):
+        """ Client EFS are plain directories of the temporary mount root. """
+        def mount_efs(self, file_system_id, client_name):
+            os.makedirs(os.path.join(mount_root, client_name), exist_ok=True)
+            return True
+
+    efs_client = FakeEfsClient(args.api_latency, args.create_delay, args.mount_target_delay)
+    secrets_client = FakeSecretsClient(args.api_latency, {MASTER_SECRET: {'username': 'postgres', 'password': 'postgres'}})
+    efs_manager = LocalEfsManager(REGION, efs_client=efs_client)
+    rds._secret_managers[REGION] = CachedSecretManager(REGION, secrets_client=secrets_client)
+    if args.fake_postgres:
+        provisioner = FakePostgresProvisioner(args.api_latency)
+    else:
+        provisioner = PostgresProvisioner(os.environ.get('PGHOST', 'localhost'), os.environ.get('PGUSER', 'postgres'),
+                                          os.environ.get('PGPASSWORD', 'postgres'), port=int(os.environ.get('PGPORT', 5432)))
+    rds._provisioners[REGION] = provisioner
+
+    if efs_manager.warm_pool:
+        # Filled before the clock starts, like a pool kept warm between runs
+        efs_manager.warm_pool.refill()
+
+    client_envs = {f"bench{run_id}_{i:03d}": envs for i in range(tenants)}
+    tracer.reset()
+    start = time.monotonic()
+    rds.prefetch_secrets(REGION, client_envs.keys())
+    results = main.run_onboarding(efs_manager, client_envs, args.workers)
+    wall = time.monotonic() - start
+
+    if not args.fake_postgres:
+        drop_databases(provisioner, [f"{client}_{env}_db" for client in client_envs for env in envs],
+                       [f"{client}_{env}_db_user" for client in client_envs for env in envs])
+        provisioner.close()
+
+    durations = [result['duration'] for result in results.values() if result['status'] == 'success']
+    failed = [client for client, result in results.items() if result['status'] != 'success']
+    return {
+        'tenants': tenants,
+        'envs_per_tenant': len(envs),
+        'failed': len(failed),
+        'wall_seconds': round(wall, 3),
+        'tenants_per_minute': round(tenants / wall * 60, 1),
+        'p50_seconds': round(statistics.median(durations), 3) if durations else None,
+        'p95_seconds': round(percentile(durations, 95), 3) if durations else None,
+        'steps': tracer.step_summary(),
+        'efs_calls': dict(efs_client.calls),
+        'secretsmanager_calls': dict(secrets_client.calls),
+    }
+
+
+def drop_databases(provisioner, db_names, role_names):
+    from psycopg2 import sql
+    with provisioner.connection(autocommit=True) as conn, conn.cursor() as cur:
+        for db_name in db_names:
+            cur.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(db_name)))
+        for role_name in role_names:
+            cur.execute(sql.SQL("DROP ROLE IF EXISTS {}").format(sql.Identifier(role_name)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the onboarding pipeline against local stand-ins")
+    parser.add_argument('--tenants', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--envs', default='prod,dev', help="comma separated envs per tenant")
+    parser.add_argument('--workers', type=int, default=None, help="defaults to ONBOARD_MAX_WORKERS")
+    parser.add_argument('--api-latency', type=float, default=0.02, help="seconds added to every fake AWS call")
+    parser.add_argument('--create-delay', type=float, default=2.0, help="seconds a file system stays 'creating'")
+    parser.add_argument('--mount-target-delay', type=float, default=2.0, help="seconds a mount target stays 'creating'")
+    parser.add_argument('--fake-postgres', action='store_true', help="do not use a local Postgres")
+    parser.add_argument('--warm-pool', type=int, default=0, help="EFS warm pool size (EFS_WARM_POOL_SIZE)")
+    args = parser.parse_args()
+
+    mount_root = tempfile.mkdtemp(prefix='onboarding-bench-')
+    try:
+        setup_environment(mount_root, args.warm_pool)
+        run_id = str(int(time.time()))[-6:]
+        reports = [run_benchmark(tenants, args.envs.split(','), args, mount_root, f"{run_id}_{tenants}")
+                   for tenants in args.tenants]
+    finally:
+        shutil.rmtree(mount_root, ignore_errors=True)
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == '__main__':
+    main()
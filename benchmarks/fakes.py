@@ -0,0 +1,229 @@
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from botocore.exceptions import ClientError
+
+
+def _client_error(code, message, operation):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+
+class FakeAwsClient:
+    """ Base of the in-process AWS fakes: per-call latency and call counters. """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_paginator(self, operation):
+        return FakePaginator(getattr(self, operation))
+
+
+class FakePaginator:
+    """ Follows Marker/NextMarker and NextToken like the botocore paginators. """
+
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        while True:
+            page = self.method(**kwargs)
+            yield page
+            if page.get('NextMarker'):
+                kwargs['Marker'] = page['NextMarker']
+            elif page.get('NextToken'):
+                kwargs['NextToken'] = page['NextToken']
+            else:
+                return
+
+
+class FakeEfsClient(FakeAwsClient):
+    """
+    EFS fake: file systems stay 'creating' for create_delay seconds and mount targets
+    stay 'creating' for mount_target_delay seconds before becoming 'available'.
+    """
+
+    def __init__(self, latency=0.0, create_delay=0.0, mount_target_delay=0.0, page_size=100):
+        super().__init__(latency)
+        self.create_delay = create_delay
+        self.mount_target_delay = mount_target_delay
+        self.page_size = page_size
+        self.file_systems = {}
+        self.mount_targets = {}
+        self.access_points = {}
+        self._ids = itertools.count(1)
+
+    def _new_id(self, prefix):
+        return f"{prefix}-{next(self._ids):08x}"
+
+    def _state(self, created_at, delay):
+        return 'available' if time.monotonic() - created_at >= delay else 'creating'
+
+    def _file_system(self, fs_id):
+        fs = self.file_systems[fs_id]
+        return {
+            'FileSystemId': fs_id,
+            'LifeCycleState': self._state(fs['created_at'], self.create_delay),
+            'NumberOfMountTargets': len(self.mount_targets.get(fs_id, [])),
+            'Encrypted': fs['Encrypted'],
+            'Tags': list(fs['Tags']),
+        }
+
+    def create_file_system(self, **kwargs):
+        self._call('CreateFileSystem')
+        fs_id = self._new_id('fs')
+        with self._lock:
+            self.file_systems[fs_id] = {'created_at': time.monotonic(), 'Tags': list(kwargs.get('Tags', [])),
+                                        'Encrypted': kwargs.get('Encrypted', False)}
+        return {'FileSystemId': fs_id, 'LifeCycleState': 'creating'}
+
+    def describe_file_systems(self, FileSystemId=None, Marker=None, MaxItems=None):
+        self._call('DescribeFileSystems')
+        with self._lock:
+            if FileSystemId:
+                if FileSystemId not in self.file_systems:
+                    raise _client_error('FileSystemNotFound', f"{FileSystemId} not found", 'DescribeFileSystems')
+                return {'FileSystems': [self._file_system(FileSystemId)]}
+            ids = sorted(self.file_systems)
+            start = int(Marker or 0)
+            size = MaxItems or self.page_size
+            page = {'FileSystems': [self._file_system(fs_id) for fs_id in ids[start:start + size]]}
+            if start + size < len(ids):
+                page['NextMarker'] = str(start + size)
+            return page
+
+    def delete_file_system(self, FileSystemId):
+        self._call('DeleteFileSystem')
+        with self._lock:
+            if self.mount_targets.get(FileSystemId):
+                raise _client_error('FileSystemInUse', f"{FileSystemId} has mount targets", 'DeleteFileSystem')
+            self.file_systems.pop(FileSystemId)
+
+    def tag_resource(self, ResourceId, Tags):
+        self._call('TagResource')
+        with self._lock:
+            keys = {tag['Key'] for tag in Tags}
+            fs = self.file_systems[ResourceId]
+            fs['Tags'] = [tag for tag in fs['Tags'] if tag['Key'] not in keys] + list(Tags)
+
+    def untag_resource(self, ResourceId, TagKeys):
+        self._call('UntagResource')
+        with self._lock:
+            fs = self.file_systems[ResourceId]
+            fs['Tags'] = [tag for tag in fs['Tags'] if tag['Key'] not in TagKeys]
+
+    def list_tags_for_resource(self, ResourceId, NextToken=None, MaxResults=None):
+        self._call('ListTagsForResource')
+        with self._lock:
+            if ResourceId not in self.file_systems:
+                raise _client_error('FileSystemNotFound', f"{ResourceId} not found", 'ListTagsForResource')
+            return {'Tags': list(self.file_systems[ResourceId]['Tags'])}
+
+    def create_mount_target(self, FileSystemId, SubnetId, SecurityGroups=None):
+        self._call('CreateMountTarget')
+        with self._lock:
+            if self._state(self.file_systems[FileSystemId]['created_at'], self.create_delay) != 'available':
+                raise _client_error('IncorrectFileSystemLifeCycleState', 'File system is not available', 'CreateMountTarget')
+            mount_target = {'MountTargetId': self._new_id('fsmt'), 'SubnetId': SubnetId, 'created_at': time.monotonic()}
+            self.mount_targets.setdefault(FileSystemId, []).append(mount_target)
+        return {'MountTargetId': mount_target['MountTargetId'], 'LifeCycleState': 'creating'}
+
+    def describe_mount_targets(self, FileSystemId=None, MountTargetId=None):
+        self._call('DescribeMountTargets')
+        with self._lock:
+            return {'MountTargets': [
+                {'MountTargetId': mt['MountTargetId'], 'FileSystemId': FileSystemId, 'SubnetId': mt['SubnetId'],
+                 'LifeCycleState': self._state(mt['created_at'], self.mount_target_delay)}
+                for mt in self.mount_targets.get(FileSystemId, [])
+            ]}
+
+    def create_access_point(self, FileSystemId, **kwargs):
+        self._call('CreateAccessPoint')
+        access_point = {'AccessPointId': self._new_id('fsap'), 'FileSystemId': FileSystemId,
+                        'Tags': list(kwargs.get('Tags', [])), 'RootDirectory': kwargs.get('RootDirectory'),
+                        'LifeCycleState': 'available'}
+        with self._lock:
+            self.access_points[access_point['AccessPointId']] = access_point
+        return dict(access_point)
+
+    def describe_access_points(self, FileSystemId=None, AccessPointId=None, NextToken=None, MaxResults=None):
+        self._call('DescribeAccessPoints')
+        with self._lock:
+            matches = [dict(ap) for ap_id, ap in sorted(self.access_points.items())
+                       if FileSystemId in (None, ap['FileSystemId']) and AccessPointId in (None, ap_id)]
+        start = int(NextToken or 0)
+        size = MaxResults or self.page_size
+        page = {'AccessPoints': matches[start:start + size]}
+        if start + size < len(matches):
+            page['NextToken'] = str(start + size)
+        return page
+
+
+class FakeSecretsClient(FakeAwsClient):
+    """ Secrets Manager fake with read-after-write consistency. """
+
+    def __init__(self, latency=0.0, secrets=None):
+        super().__init__(latency)
+        self.secrets = {name: json.dumps(value) for name, value in (secrets or {}).items()}
+
+    def get_secret_value(self, SecretId):
+        self._call('GetSecretValue')
+        with self._lock:
+            if SecretId not in self.secrets:
+                raise _client_error('ResourceNotFoundException', f"Secret {SecretId} not found", 'GetSecretValue')
+            return {'Name': SecretId, 'SecretString': self.secrets[SecretId]}
+
+    def batch_get_secret_value(self, SecretIdList):
+        self._call('BatchGetSecretValue')
+        with self._lock:
+            return {
+                'SecretValues': [{'Name': name, 'SecretString': self.secrets[name]}
+                                 for name in SecretIdList if name in self.secrets],
+                'Errors': [{'SecretId': name, 'ErrorCode': 'ResourceNotFoundException'}
+                           for name in SecretIdList if name not in self.secrets],
+            }
+
+    def list_secrets(self, NextToken=None, MaxResults=100):
+        self._call('ListSecrets')
+        with self._lock:
+            names = sorted(self.secrets)
+        start = int(NextToken or 0)
+        page = {'SecretList': [{'Name': name} for name in names[start:start + MaxResults]]}
+        if start + MaxResults < len(names):
+            page['NextToken'] = str(start + MaxResults)
+        return page
+
+    def create_secret(self, Name, SecretString):
+        self._call('CreateSecret')
+        with self._lock:
+            if Name in self.secrets:
+                raise _client_error('ResourceExistsException', f"Secret {Name} already exists", 'CreateSecret')
+            self.secrets[Name] = SecretString
+        return {'Name': Name}
+
+    def update_secret(self, SecretId, SecretString):
+        self._call('UpdateSecret')
+        with self._lock:
+            self.secrets[SecretId] = SecretString
+        return {'Name': SecretId}
+
+
+class FakePostgresProvisioner:
+    """ Stand-in for PostgresProvisioner when no local Postgres is available. """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.databases = set()
+
+    def provision(self, db_name, role_name, role_password, template=None):
+        time.sleep(self.latency)
+        self.databases.add(db_name)
@@ -0,0 +1,62 @@
+import logging
+import threading
+
+
+class AccessPointCache:
+    """
+    Access points of each file system, fetched once (all pages) and indexed by their
+    Name and Client tags.
+    """
+
+    def __init__(self, efs_client):
+        self.efs_client = efs_client
+        self._lock = threading.Lock()
+        self._by_name = {}
+        self._by_client = {}
+
+    def _load(self, file_system_id):
+        """ Fetch every access point of the file system unless it is already cached. Caller holds the lock. """
+        if file_system_id in self._by_name:
+            return
+        by_name, by_client = {}, {}
+        kwargs = {'FileSystemId': file_system_id}
+        while True:
+            response = self.efs_client.describe_access_points(**kwargs)
+            for ap in response.get('AccessPoints', []):
+                tags = {tag.get('Key'): tag.get('Value') for tag in ap.get('Tags', [])}
+                if tags.get('Name'):
+                    by_name[tags['Name']] = ap['AccessPointId']
+                if tags.get('Client'):
+                    by_client.setdefault(tags['Client'], []).append(ap['AccessPointId'])
+            if not response.get('NextToken'):
+                break
+            kwargs['NextToken'] = response['NextToken']
+        self._by_name[file_system_id] = by_name
+        self._by_client[file_system_id] = by_client
+
+    def get(self, file_system_id, access_point_name):
+        with self._lock:
+            self._load(file_system_id)
+            return self._by_name[file_system_id].get(access_point_name)
+
+    def for_client(self, file_system_id, client_name):
+        with self._lock:
+            self._load(file_system_id)
+            return list(self._by_client[file_system_id].get(client_name, []))
+
+    def missing(self, file_system_id, access_point_names):
+        with self._lock:
+            self._load(file_system_id)
+            return [name for name in access_point_names if name not in self._by_name[file_system_id]]
+
+    def add(self, file_system_id, access_point_name, client_name, access_point_id):
+        with self._lock:
+            self._load(file_system_id)
+            self._by_name[file_system_id][access_point_name] = access_point_id
+            self._by_client[file_system_id].setdefault(client_name, []).append(access_point_id)
+
+    def invalidate(self, file_system_id):
+        with self._lock:
+            self._by_name.pop(file_system_id, None)
+            self._by_client.pop(file_system_id, None)
+            logging.info(f"Access point cache invalidated for file system '{file_system_id}'.")
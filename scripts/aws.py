@@ -0,0 +1,35 @@
+import os
+import threading
+from throttle import service_limit
+
+# One boto3 session and one client per (service, region) for the whole process: every module
+# shares the same credentials resolution and HTTP connection pools. boto3 is only imported on first use.
+_session = None
+_clients = {}
+_lock = threading.Lock()
+
+
+def max_pool_connections(service):
+    """ HTTP connections per client: the service concurrency limit plus room for the background pollers. """
+    return int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", max(10, service_limit(service) * 2)))
+
+
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            import boto3
+            _session = boto3.session.Session()
+        return _session
+
+
+def get_client(service, region):
+    """ Shared boto3 client of the service in the region, created on first use. Clients are thread safe, their creation is not. """
+    session = get_session()
+    with _lock:
+        key = (service, region)
+        if key not in _clients:
+            from botocore.config import Config
+            config = Config(max_pool_connections=max_pool_connections(service))
+            _clients[key] = session.client(service, region_name=region, config=config)
+        return _clients[key]
@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import sys
+from postgres import PostgresProvisioner
+
+# Seeds are plain SQL dumps of a database freshly initialised by dotCMS, one per version:
+#   pg_dump --no-owner --no-privileges --inserts <db> > db_templates/21.06.sql
+SEED_DIR = os.environ.get("RDS_TEMPLATE_SEED_DIR", "./db_templates")
+
+
+def read_seed(path):
+    """ SQL of a seed file, without the psql meta-commands (\\connect, \\restrict...) that only psql understands. """
+    with open(path, 'r') as file:
+        return ''.join(line for line in file if not line.startswith('\\'))
+
+
+def seed_path(dotcms_version):
+    return os.path.join(SEED_DIR, f"{dotcms_version}.sql")
+
+
+def spec_versions(region):
+    """ Every dotcms_version used by the customer specs of the region. """
+    from rds import customer_specs
+    return sorted({str(spec['dotcms_version']) for envs in customer_specs(region).values()
+                   for spec in (envs or {}).values() if spec and spec.get('dotcms_version')})
+
+
+def get_provisioner():
+    """ Local Postgres when PGHOST is set, the region RDS otherwise. """
+    if os.environ.get("PGHOST"):
+        return PostgresProvisioner(os.environ["PGHOST"], os.environ.get("PGUSER", "postgres"),
+                                   os.environ.get("PGPASSWORD", "postgres"), port=int(os.environ.get("PGPORT", 5432)))
+    import rds
+    return rds.get_provisioner(os.environ.get("AWS_REGION"))
+
+
+def refresh(provisioner, versions, force=False):
+    """ Rebuild the templates whose seed changed. Returns {version: 'built' | 'up to date' | 'no seed'}. """
+    results = {}
+    for version in versions:
+        path = seed_path(version)
+        if not os.path.exists(path):
+            logging.warning(f"No seed {path} for dotCMS {version}")
+            results[version] = 'no seed'
+            continue
+        built = provisioner.build_template(version, read_seed(path), force)
+        results[version] = 'built' if built else 'up to date'
+    return results
+
+
+if __name__ == '__main__':
+    # Usage: python3 scripts/db_templates.py list
+    #        python3 scripts/db_templates.py build <dotcms_version> [seed.sql] [--force]
+    #        AWS_REGION=<region> python3 scripts/db_templates.py refresh [dotcms_version ...] [--force]
+    logging.basicConfig(level=logging.INFO)
+    force = '--force' in sys.argv[1:]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    command = args[0] if args else 'list'
+
+    provisioner = get_provisioner()
+    try:
+        if command == 'list':
+            print(json.dumps(provisioner.list_templates(), indent=2))
+        elif command == 'build':
+            version = args[1]
+            provisioner.build_template(version, read_seed(args[2] if len(args) > 2 else seed_path(version)), force)
+        elif command == 'refresh':
+            versions = args[1:] or spec_versions(os.environ.get("AWS_REGION"))
+            results = refresh(provisioner, versions, force)
+            print(json.dumps(results, indent=2))
+            if 'no seed' in results.values():
+                sys.exit(1)
+        else:
+            sys.exit(f"Unknown command {command}, expected list, build or refresh")
+    finally:
+        provisioner.close()
@@ -1,21 +1,36 @@
 import logging
-import time
-import boto3
 from botocore.exceptions import ClientError
-import json
+import grp
 import os
+import pwd
 import subprocess
+import sys
+from aws import get_client
+from regions import get_region_config
+from throttle import ThrottledClient
+from waiter import EfsStatusWaiter
+from inventory import EfsInventory
+from access_points import AccessPointCache
+from seeding import seed_env_tree
+from warm_pool import EfsWarmPool, WARM_POOL_SIZE
+from telemetry import span
+
+# Root under which client EFS are mounted and where the glowroot template lives
+MOUNT_ROOT = os.environ.get("ONBOARDING_MOUNT_ROOT", "/mnt")
+# Owner of the env trees on EFS
+EFS_OWNER = os.environ.get("EFS_OWNER", "dotcms")
+EFS_GROUP = os.environ.get("EFS_GROUP", EFS_OWNER)
+SEEDING_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'seeding.py')
 
 class AwsEfsManager:
-    def __init__(self, region):
-        self.efs_client = boto3.client('efs', region_name=region)
+    def __init__(self, region, efs_client=None):
+        self.efs_client = ThrottledClient(efs_client or get_client('efs', region), 'efs')
         self.region = region
-        self.regions = {
-            'ca-central-1': {"subnet_ids": ["subnet-06f45035183d72a63"], "security_groups":["sg-084bfe2d8728356fe"], "glowroot": "http://glowrootcentral.dotcmscloud.com:8181"}, # AZ MUST BE DIFFERENT FOR EFS MOUNT TARGET
-            'us-east-1': {"subnet_ids": ["subnet-088928fa05998da0a"], "security_groups":["sg-04e82704b331280ed"]},
-            'us-east-2': {"subnet_ids": ["id_a","id_b"], "security_groups":["a","b"]},
-            'ap-south-2': {"subnet_ids": ["id_a","id_b"], "security_groups":["a","b"]}
-        }
+        self.waiter = EfsStatusWaiter(self.efs_client)
+        self.inventory = EfsInventory(self.efs_client)
+        self.waiter.add_sweep_listener(self.inventory.update_from)
+        self.access_points = AccessPointCache(self.efs_client)
+        self.warm_pool = EfsWarmPool(self) if WARM_POOL_SIZE else None
 
     def log_error(self, error):
         logging.error(f"An error occurred: {error}")
@@ -28,23 +43,13 @@ class AwsEfsManager:
             self.log_error(e)
             return None
 
-    def _wait_for_status(self, check_status_func, success_status, timeout=300, interval=10):
-        """ Generic method to wait for a specific status. """
-        elapsed_time = 0
-        while elapsed_time < timeout:
-            if check_status_func() == success_status:
-                return True
-            time.sleep(interval)
-            elapsed_time += interval
-        return False
-    
     def create_efs(self, client_name):
         efs_name = f"{client_name}-k8s"
         logging.info(f"Starting the process to create/check EFS for '{efs_name}'.")
         file_system_id = self.efs_exists(efs_name)
 
         # Get region configuration
-        region_config = self.regions.get(self.region)
+        region_config = get_region_config(self.region)
         if not region_config:
             raise ValueError(f"No configuration found for region {self.region}")
 
@@ -55,19 +60,35 @@ class AwsEfsManager:
         if not file_system_id:
             try:
                 logging.info(f"EFS '{efs_name}' not found.")
+                tags = [
+                    {'Key': 'Name', 'Value': efs_name},
+                    {'Key': 'dotcms.client.name.short', 'Value': client_name},
+                    {'Key': 'aws.backup', 'Value': 'standard'}
+                ]
+                if self.warm_pool:
+                    # The pool is refilled by scripts/warm_pool.py once the run is over
+                    try:
+                        with span('claim_warm_efs', client_name):
+                            file_system_id = self.warm_pool.claim(tags)
+                    except ClientError as e:
+                        logging.warning(f"Could not claim a warm EFS for '{efs_name}', creating one: {e}")
+                        file_system_id = None
+                    if file_system_id:
+                        self.inventory.add(file_system_id, tags)
+                        logging.info(f"EFS '{efs_name}' claimed from the warm pool with ID: {file_system_id}")
+                        return file_system_id
+
                 logging.info(f"Creating EFS '{efs_name}'...")
                 response = self.efs_client.create_file_system(
                     PerformanceMode='generalPurpose', 
                     ThroughputMode='bursting', 
                     Encrypted=True, 
-                    Tags=[
-                        {'Key': 'Name', 'Value': efs_name},
-                        {'Key': 'dotcms.client.name.short', 'Value': client_name},
-                        {'Key': 'aws.backup', 'Value': 'standard'}
-                    ]
+                    Tags=tags
                 )
                 file_system_id = response['FileSystemId']
-                self.wait_for_efs_available(file_system_id)
+                self.inventory.add(file_system_id, tags)
+                with span('wait_efs_available', client_name):
+                    self.wait_for_efs_available(file_system_id)
                 logging.info(f"EFS '{efs_name}' created successfully with ID: {file_system_id}")
                 
                 # Create mount targets
@@ -75,7 +96,9 @@ class AwsEfsManager:
                     self.create_mount_target(file_system_id, subnet_id, security_groups)
                     
                 # After creating all mount targets, wait for them to become available
-                if not self.wait_for_mount_target_availability(file_system_id):
+                with span('wait_mount_targets', client_name):
+                    mount_targets_available = self.wait_for_mount_target_availability(file_system_id)
+                if not mount_targets_available:
                     logging.warning(f"Not all mount targets for EFS {file_system_id} became available.")
                     return None
                   
@@ -91,15 +114,14 @@ class AwsEfsManager:
         return file_system_id
 
     def efs_exists(self, efs_name):
-        response = self._execute_aws_call(self.efs_client.describe_file_systems)
-        return next((fs['FileSystemId'] for fs in response.get('FileSystems', []) 
-                     if any(tag.get('Value') == efs_name for tag in fs.get('Tags', []))), None)    
+        try:
+            return self.inventory.lookup(efs_name)
+        except ClientError as e:
+            self.log_error(e)
+            return None
 
     def wait_for_efs_available(self, file_system_id):
-        return self._wait_for_status(
-            lambda: self._execute_aws_call(self.efs_client.describe_file_systems, FileSystemId=file_system_id).get('FileSystems', [{}])[0].get('LifeCycleState'),
-            'available'
-        )
+        return self.waiter.wait_for_file_system(file_system_id, 'available')
      
     def create_mount_target(self, file_system_id, subnet_id, security_groups):
         try:
@@ -121,13 +143,7 @@ class AwsEfsManager:
     def wait_for_mount_target_availability(self, file_system_id):
         logging.info(f"Waiting for all mount targets of EFS {file_system_id} to become available.")
 
-        def all_mount_targets_available():
-            response = self._execute_aws_call(self.efs_client.describe_mount_targets, FileSystemId=file_system_id)
-            if not response or 'MountTargets' not in response:
-                return False
-            return all(mount['LifeCycleState'] == 'available' for mount in response['MountTargets'])
-
-        if self._wait_for_status(all_mount_targets_available, True):
+        if self.waiter.wait_for_mount_targets(file_system_id):
             logging.info(f"All mount targets for EFS {file_system_id} are now available.")
             return True
         else:
@@ -137,39 +153,47 @@ class AwsEfsManager:
     def access_point_exists(self, file_system_id, access_point_name):
         logging.info(f"Checking if access point '{access_point_name}' exists for file system '{file_system_id}'.")
         try:
-            response = self.efs_client.describe_access_points(FileSystemId=file_system_id)
-            for ap in response.get('AccessPoints', []):
-                for tag in ap.get('Tags', []):
-                    if tag.get('Key') == 'Name' and tag.get('Value') == access_point_name:
-                        return True
-            return False
+            return self.access_points.get(file_system_id, access_point_name) is not None
         except ClientError as e:
             self.log_error(e)
             return False
 
     def create_access_point(self, file_system_id, client_name, env):
-        access_point_name = env
-        if self.access_point_exists(file_system_id, access_point_name):
-            logging.info(f"Access point '{access_point_name}' already exists. Skipping access point creation for '{access_point_name}'")
-            return None
+        return self.create_access_points(file_system_id, client_name, [env]).get(env)
 
+    def create_access_points(self, file_system_id, client_name, envs):
+        """ Ensure one access point per env exists, with a single describe call per file system. Returns {env: AccessPointId}. """
         try:
-            access_point_options = {
-                'FileSystemId': file_system_id, 
-                'PosixUser': {'Uid': 65000, 'Gid': 65000},
-                'RootDirectory': {'Path': f"/{env}", 'CreationInfo': {'OwnerUid': 65000, 'OwnerGid': 65000, 'Permissions': '0755'}},
-                'Tags': [{'Key': 'Name', 'Value': access_point_name}, {'Key': 'Client', 'Value': client_name}]
-            }
-            response = self.efs_client.create_access_point(**access_point_options)
-            access_point_id = response['AccessPointId']
-            logging.info(f"Access point '{access_point_id}' created for {client_name} in {env} environment.")
-            return access_point_id
+            missing = self.access_points.missing(file_system_id, envs)
         except ClientError as e:
             self.log_error(e)
-            return None
+            return {}
+
+        for env in envs:
+            if env not in missing:
+                logging.info(f"Access point '{env}' already exists. Skipping access point creation for '{env}'")
+
+        for env in missing:
+            access_point_name = env
+            try:
+                access_point_options = {
+                    'FileSystemId': file_system_id, 
+                    'PosixUser': {'Uid': 65000, 'Gid': 65000},
+                    'RootDirectory': {'Path': f"/{env}", 'CreationInfo': {'OwnerUid': 65000, 'OwnerGid': 65000, 'Permissions': '0755'}},
+                    'Tags': [{'Key': 'Name', 'Value': access_point_name}, {'Key': 'Client', 'Value': client_name}]
+                }
+                response = self.efs_client.create_access_point(**access_point_options)
+                access_point_id = response['AccessPointId']
+                self.access_points.add(file_system_id, access_point_name, client_name, access_point_id)
+                logging.info(f"Access point '{access_point_id}' created for {client_name} in {env} environment.")
+            except ClientError as e:
+                self.log_error(e)
+
+        return {env: self.access_points.get(file_system_id, env) for env in envs
+                if self.access_points.get(file_system_id, env)}
         
     def mount_efs(self, file_system_id, client_name):
-        client_path = f'/mnt/{client_name}'
+        client_path = os.path.join(MOUNT_ROOT, client_name)
         
         # Check if the mount point already has a mounted file system
         if not os.path.ismount(client_path):
@@ -187,40 +211,50 @@ class AwsEfsManager:
                 logging.info(f"EFS {file_system_id} mounted successfully at {client_path}")
             except subprocess.CalledProcessError as e:
                 self.log_error(f"Error occurred while mounting EFS: {e}")
+                return False
         else:
             logging.info(f"EFS is already mounted at {client_path}")
+        return True
             
     def efs_folder_setup(self, client_name, env):
-        region_config = self.regions.get(self.region)
-        assets_path = f'/mnt/{client_name}/{env}/assets'
-        glowroot_path = f'/mnt/{client_name}/{env}/glowroot'
-        
-        if not os.path.exists(assets_path):
-            try:
-                # Create assets directory and copy glowroot
-                logging.info(f"Creating directories for {env}")
-                subprocess.run(f"sudo mkdir -p {assets_path}", check=True, shell=True)
-                logging.info(f"Directories {assets_path} sucesfully created")
-                
-                logging.info(f"Copying glowroot to {glowroot_path} and updating glowroot.properties")
-                subprocess.run(f"sudo cp -r /mnt/glowroot {glowroot_path}", check=True, shell=True)
-            
-                # Write to glowroot.properties
-                content = f"agent.id=k8s.{client_name}::{env}\ncollector.address={region_config['glowroot']}\n"
-                subprocess.run(f"echo '{content}' | sudo tee {os.path.join(glowroot_path, 'glowroot.properties')}", check=True, shell=True)
-                
-                logging.info(f"Setting up directories permissions")
-                # Change ownership
-                subprocess.run(f"sudo chown -R dotcms:dotcms /mnt/{client_name}/{env}", check=True, shell=True)
+        region_config = get_region_config(self.region)
+        env_path = os.path.join(MOUNT_ROOT, client_name, env)
+        assets_path = os.path.join(env_path, 'assets')
 
-                logging.info(f"Permissions configured:")
-                subprocess.run(f"ls -lha /mnt/{client_name}/{env}", check=True, shell=True)
-                
-                
-            except OSError as e:
-                self.log_error(f"Error during setup: {e}")
-        else:
+        if os.path.exists(assets_path):
             logging.info(f"'assets' directory already exists at {assets_path}")
+            return True
+
+        content = f"agent.id=k8s.{client_name}::{env}\ncollector.address={region_config.get('glowroot', '')}\n"
+        try:
+            owner = pwd.getpwnam(EFS_OWNER)
+            group = grp.getgrnam(EFS_GROUP)
+        except KeyError:
+            self.log_error(f"User '{EFS_OWNER}' or group '{EFS_GROUP}' does not exist, cannot set up {env_path}")
+            return False
+
+        # Setting ownership while copying needs root (or to already be the owner)
+        if os.geteuid() not in (0, owner.pw_uid):
+            return self._efs_folder_setup_sudo(env_path, content)
+
+        try:
+            logging.info(f"Seeding {env_path} from {MOUNT_ROOT}/glowroot")
+            seed_env_tree(env_path, os.path.join(MOUNT_ROOT, 'glowroot'), content, owner.pw_uid, group.gr_gid)
+        except OSError as e:
+            self.log_error(f"Error during setup: {e}")
+            return False
+        return True
+
+    def _efs_folder_setup_sudo(self, env_path, content):
+        """ Runners without root: the same native seeding (ownership set as files are written) in a single sudo call. """
+        try:
+            logging.info(f"Seeding {env_path} from {MOUNT_ROOT}/glowroot with sudo")
+            subprocess.run(["sudo", sys.executable, SEEDING_SCRIPT, env_path, os.path.join(MOUNT_ROOT, 'glowroot'),
+                            EFS_OWNER, EFS_GROUP], input=content, text=True, check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.log_error(f"Error during setup: {e}")
+            return False
+        return True
     
 ################## 
 
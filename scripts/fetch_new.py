@@ -2,6 +2,16 @@ import yaml
 import os
 import json
 import base64
+import hashlib
+import logging
+import subprocess
+
+# Use the libyaml (C) loader when PyYAML was built with it
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Manifests survive between runs on the self-hosted runner (checkout wipes the workspace)
+CACHE_DIR = os.environ.get("ONBOARDING_CACHE_DIR", os.path.expanduser("~/.cache/automated-onboarding"))
+
 
 def read_yaml_files(directory):
     data = []
@@ -9,50 +19,150 @@ def read_yaml_files(directory):
         if file.endswith(".yaml"):
             full_path = os.path.join(directory, file)
             with open(full_path, 'r') as file:
-                yaml_data = yaml.safe_load(file)
+                yaml_data = yaml.load(file, Loader=YamlLoader)
                 data.append(yaml_data)
     return data
 
-def find_new_customers_or_environments(customers_data, onboarded_file):
-    with open(onboarded_file, 'r') as file:
-        onboarded_data = yaml.safe_load(file)
+
+def load_manifest(manifest_path):
+    """ {'commit': sha the manifest was built at (or None), 'files': {file: entry}}. """
+    if manifest_path and os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r') as file:
+                manifest = json.load(file)
+            if 'files' in manifest:
+                return manifest
+            # Manifests written before the commit was recorded: entries are kept, every file is hashed
+            return {'commit': None, 'files': manifest}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable manifest {manifest_path}: {e}")
+    return {'commit': None, 'files': {}}
+
+
+def save_manifest(manifest_path, manifest):
+    if not manifest_path:
+        return
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, manifest_path)
+
+
+def _git(*args):
+    return subprocess.run(["git", *args], check=True, capture_output=True, text=True).stdout
+
+
+def clean_head_commit(directory):
+    """ HEAD sha if the files under directory match it exactly, None otherwise (or outside of git). """
+    try:
+        if _git("status", "--porcelain", "--", directory).strip():
+            return None
+        return _git("rev-parse", "HEAD").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def changed_files_since(commit, directory):
+    """ Files under directory that differ (committed or not) from commit according to git, or None if git cannot tell. """
+    if not commit or set(commit) == {'0'}:
+        return None
+    try:
+        output = _git("diff", "--name-only", commit, "--", directory)
+    except (OSError, subprocess.CalledProcessError) as e:
+        logging.warning(f"Could not diff customer files against {commit}, hashing them instead: {e}")
+        return None
+    return {os.path.normpath(path) for path in output.splitlines()}
+
+
+def read_customer_envs(directory, manifest_path=None, use_git=True):
+    """
+    Return {customer: [envs]} for every customer file of the directory.
+
+    Only files whose content hash differs from the manifest are parsed. With use_git, files that
+    git reports unchanged since the commit the manifest was built at are not even read; a manifest
+    without a commit (first run, dirty checkout, unknown history) gets every file hashed.
+    """
+    manifest = load_manifest(manifest_path)
+    changed_files = changed_files_since(manifest['commit'], directory) if use_git else None
+    new_manifest = {}
+    parsed = 0
+
+    for file in sorted(os.listdir(directory)):
+        if not file.endswith(".yaml"):
+            continue
+        full_path = os.path.join(directory, file)
+        entry = manifest['files'].get(file)
+
+        if entry and changed_files is not None and os.path.normpath(full_path) not in changed_files:
+            new_manifest[file] = entry
+            continue
+
+        with open(full_path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if entry and entry['sha256'] == digest:
+            new_manifest[file] = entry
+            continue
+
+        yaml_data = yaml.load(content, Loader=YamlLoader) or {}
+        new_manifest[file] = {
+            'sha256': digest,
+            'customers': {customer: list(envs or {}) for customer, envs in yaml_data.items()}
+        }
+        parsed += 1
+
+    logging.info(f"Parsed {parsed} changed customer file(s) out of {len(new_manifest)} in {directory}")
+    save_manifest(manifest_path, {'commit': clean_head_commit(directory) if use_git else None, 'files': new_manifest})
+    return {k: v for entry in new_manifest.values() for k, v in entry['customers'].items()}
+
+
+def find_new_customers_or_environments(customers_data, onboarded_file, region=None):
+    # state_store imports this module
+    from state_store import load_onboarded
+    onboarded_data = load_onboarded(region, onboarded_file)
 
     new_customers_or_environments = {}
 
     for customer, environments in customers_data.items():
-        if customer not in onboarded_data:
-            new_customers_or_environments[customer] = list(environments.keys())
-        else:
-            for environment in environments:
-                if environment not in onboarded_data[customer]:
-                    if customer not in new_customers_or_environments:
-                        new_customers_or_environments[customer] = []
-                    new_customers_or_environments[customer].append(environment)
+        onboarded_envs = onboarded_data.get(customer, set())
+        # Keep the order of the customer file for the envs that are not onboarded yet
+        new_envs = [environment for environment in environments if environment not in onboarded_envs]
+        if new_envs:
+            new_customers_or_environments[customer] = new_envs
 
     return new_customers_or_environments
 
-# Define regions | MOVE THIS TO GIT ENV VARIABLES
-regions = [os.environ.get("AWS_REGION")]
-
-# Initialize the dictionary to store results
-region_results = {}
 
-# Loop over each region
-for region in regions:
+def find_region_changes(region, incremental=True):
     directory = f'./customers/{region}/'
     onboarded_file = f'./config/{region}.yaml'
 
-    # Use the existing logic for each region
-    obtained_data = read_yaml_files(directory)
-    consolidated_customers_data = {k: v for d in obtained_data for k, v in d.items()}
-    results = find_new_customers_or_environments(consolidated_customers_data, onboarded_file)
+    if incremental:
+        manifest_path = os.path.join(CACHE_DIR, f"manifest-{region}.json")
+        consolidated_customers_data = read_customer_envs(directory, manifest_path)
+    else:
+        obtained_data = read_yaml_files(directory)
+        consolidated_customers_data = {k: v for d in obtained_data for k, v in d.items()}
+    return find_new_customers_or_environments(consolidated_customers_data, onboarded_file, region)
+
+
+if __name__ == '__main__':
+    # Define regions | MOVE THIS TO GIT ENV VARIABLES
+    regions = [os.environ.get("AWS_REGION")]
+    incremental = os.environ.get("FETCH_INCREMENTAL", "true").lower() != "false"
+
+    # Initialize the dictionary to store results
+    region_results = {}
 
-    json_str = json.dumps(results)
-    # Store the result in the dictionary
-    region_results[region] = json_str
+    # Loop over each region
+    for region in regions:
+        results = find_region_changes(region, incremental)
+        # Store the result in the dictionary
+        region_results[region] = json.dumps(results)
 
-# Print or use the results as needed
-print(json_str)
+    # Print or use the results as needed
+    print(region_results[os.environ.get("AWS_REGION")])
 
 # # Encode the JSON string to bytes
 # json_bytes = json_str.encode('utf-8')
@@ -60,4 +170,4 @@ print(json_str)
 # # Base64 encode the bytes
 # base64_str = base64.b64encode(json_bytes).decode('utf-8')
 
-# print(f"base64_str")
\ No newline at end of file
+# print(f"base64_str")
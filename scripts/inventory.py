@@ -0,0 +1,64 @@
+import logging
+import os
+import threading
+import time
+from waiter import describe_all_file_systems
+
+# Tags whose values identify the file system of a client
+INDEXED_TAGS = ('Name', 'dotcms.client.name.short')
+
+
+class EfsInventory:
+    """
+    In-process index of the region file systems, keyed by their Name and
+    dotcms.client.name.short tag values.
+
+    The index is loaded with a single paginated sweep, kept up to date by the status
+    waiter sweeps and by create_efs, and fully reloaded once it is older than ttl seconds.
+    """
+
+    def __init__(self, efs_client, ttl=None):
+        self.efs_client = efs_client
+        self.ttl = ttl if ttl is not None else int(os.environ.get("EFS_INVENTORY_TTL", 300))
+        self._lock = threading.Lock()
+        self._by_tag_value = {}
+        self._loaded_at = None
+
+    def lookup(self, name):
+        """ Return the FileSystemId tagged with the given name, or None. """
+        with self._lock:
+            if self._is_stale():
+                self._reload()
+            return self._by_tag_value.get(name)
+
+    def refresh(self):
+        with self._lock:
+            self._reload()
+
+    def add(self, file_system_id, tags):
+        """ Index a file system we just created without another describe call. """
+        with self._lock:
+            self._index(file_system_id, tags)
+
+    def update_from(self, file_systems):
+        """ Merge the result of a full describe_file_systems sweep done elsewhere. """
+        with self._lock:
+            for fs in file_systems:
+                self._index(fs['FileSystemId'], fs.get('Tags', []))
+            self._loaded_at = time.monotonic()
+
+    def _is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def _reload(self):
+        file_systems = describe_all_file_systems(self.efs_client)
+        self._by_tag_value = {}
+        for fs in file_systems:
+            self._index(fs['FileSystemId'], fs.get('Tags', []))
+        self._loaded_at = time.monotonic()
+        logging.info(f"Loaded EFS inventory with {len(file_systems)} file system(s)")
+
+    def _index(self, file_system_id, tags):
+        for tag in tags:
+            if tag.get('Key') in INDEXED_TAGS and tag.get('Value'):
+                self._by_tag_value[tag['Value']] = file_system_id
@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timezone
+from fetch_new import CACHE_DIR
+
+# env value of the steps done once per client (e.g. the client EFS)
+CLIENT_STEP = '*'
+
+
+def default_journal_path():
+    return os.environ.get("ONBOARDING_JOURNAL", os.path.join(CACHE_DIR, "journal.sqlite"))
+
+
+class OnboardingJournal:
+    """
+    Durable record of the onboarding steps completed per (region, client, env, step), with the
+    resource ids they produced. A re-run skips completed steps without calling AWS again.
+    """
+
+    def __init__(self, region, path=None):
+        self.region = region
+        self.path = path or default_journal_path()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS steps (
+                region TEXT NOT NULL,
+                client TEXT NOT NULL,
+                env TEXT NOT NULL,
+                step TEXT NOT NULL,
+                status TEXT NOT NULL,
+                resources TEXT,
+                error TEXT,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (region, client, env, step)
+            )
+        """)
+
+    def get(self, client, env, step):
+        """ Resources recorded by a completed step, or None if the step is not completed. """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT resources FROM steps WHERE region = ? AND client = ? AND env = ? AND step = ? AND status = 'done'",
+                (self.region, client, env, step)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _record(self, client, env, step, status, resources=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO steps (region, client, env, step, status, resources, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.region, client, env, step, status, json.dumps(resources) if resources is not None else None,
+                 error, datetime.now(timezone.utc).isoformat()))
+
+    def complete(self, client, env, step, resources):
+        self._record(client, env, step, 'done', resources)
+
+    def fail(self, client, env, step, error):
+        self._record(client, env, step, 'failed', error=str(error))
+
+    def run(self, client, env, step, func):
+        """
+        Return the recorded resources of a completed step, otherwise run func and record its
+        result. func returns the resources dict of the step, a falsy value means it failed.
+        """
+        resources = self.get(client, env, step)
+        if resources is not None:
+            logging.info(f"Step '{step}' already completed for {client} {env}: {resources}. Skipping.")
+            return resources
+        try:
+            resources = func()
+        except Exception as e:
+            self.fail(client, env, step, e)
+            raise
+        if resources:
+            self.complete(client, env, step, resources)
+        else:
+            self.fail(client, env, step, "step returned no result")
+        return resources
+
+    def clear(self, client):
+        """ Forget every step of a client. Called once it is recorded in config, so a later re-onboarding starts over. """
+        with self._lock:
+            self._conn.execute("DELETE FROM steps WHERE region = ? AND client = ?", (self.region, client))
+
+    def entries(self, client=None):
+        with self._lock:
+            query = "SELECT client, env, step, status, resources, error, updated_at FROM steps WHERE region = ?"
+            params = [self.region]
+            if client:
+                query += " AND client = ?"
+                params.append(client)
+            rows = self._conn.execute(query + " ORDER BY client, env, step", params).fetchall()
+        return [dict(zip(('client', 'env', 'step', 'status', 'resources', 'error', 'updated_at'), row)) for row in rows]
+
+    def close(self):
+        self._conn.close()
+
+
+class NullJournal:
+    """ Journal that remembers nothing, every step runs. """
+
+    def run(self, client, env, step, func):
+        return func()
+
+    def get(self, client, env, step):
+        return None
+
+    def complete(self, client, env, step, resources):
+        pass
+
+
+if __name__ == '__main__':
+    # Usage: python3 scripts/journal.py <region> [client]
+    journal = OnboardingJournal(sys.argv[1])
+    for entry in journal.entries(sys.argv[2] if len(sys.argv) > 2 else None):
+        print(json.dumps(entry))
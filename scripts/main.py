@@ -1,40 +1,208 @@
 import logging
-import time
-import boto3
-from botocore.exceptions import ClientError
 import json
 import os
-import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from efs import AwsEfsManager
-from rds import setup_rds_for_environment
+from rds import ensure_client_secret, provision_database, prefetch_secrets
+from telemetry import span, write_trace, default_trace_path
+from journal import OnboardingJournal, NullJournal, CLIENT_STEP
+from taskgraph import TaskGraph
 
-# print(os.environ)
-region = os.environ.get("AWS_REGION")
-region_client_env_data = os.environ.get("TO_ONBOARD")
 
-# Initialize the AWS EFS Manager
-efs_manager = AwsEfsManager(region)
+class OnboardingError(Exception):
+    pass
 
-# Check if region_client_env_data is not None
-if region_client_env_data:
-    # Parse the JSON string into a Python dictionary
-    try:
-        client_envs = json.loads(region_client_env_data)
 
-        for client, envs in client_envs.items():
-            for env in envs:
-                # Create EFS file system for each client and environment
+def build_client_graph(efs_manager, client, envs, journal=None):
+    """
+    Onboarding steps of a client as a task graph. The EFS branch
+    (create_efs -> access points / mount -> folder setup) and the secret -> database branch
+    of each env do not depend on each other and run at the same time.
+    Steps already completed in the journal are skipped.
+    """
+    journal = journal or NullJournal()
+    graph = TaskGraph(client)
+
+    # Create (or find) the client EFS file system, shared by all of its environments
+    def create_efs(results):
+        def step():
+            with span('create_efs', client):
                 file_system_id = efs_manager.create_efs(client)
+            return {'FileSystemId': file_system_id} if file_system_id else None
+
+        efs = journal.run(client, CLIENT_STEP, 'create_efs', step)
+        if not efs:
+            raise OnboardingError(f"EFS could not be created or found for '{client}'")
+        return efs['FileSystemId']
+
+    # Create the access points of every environment with a single describe call
+    def create_access_points(results):
+        file_system_id = results['create_efs']
+        pending_envs = [env for env in envs if journal.get(client, env, 'access_point') is None]
+        if not pending_envs:
+            return
+        with span('create_access_points', client):
+            access_point_ids = efs_manager.create_access_points(file_system_id, client, pending_envs)
+        print(f"Access Point IDs for {client}: {access_point_ids}")
+        for env, access_point_id in access_point_ids.items():
+            journal.complete(client, env, 'access_point', {'AccessPointId': access_point_id})
+        missing = [env for env in pending_envs if env not in access_point_ids]
+        if missing:
+            raise OnboardingError(f"Access points could not be created for '{client}': {missing}")
+
+    def mount_efs(results):
+        file_system_id = results['create_efs']
+        if all(journal.get(client, env, 'efs_folder_setup') is not None for env in envs):
+            return
+        with span('mount_efs', client):
+            mounted = efs_manager.mount_efs(file_system_id, client)
+        if not mounted:
+            raise OnboardingError(f"EFS {file_system_id} could not be mounted for '{client}'")
+
+    def folder_setup(env, results):
+        def step():
+            with span('efs_folder_setup', client, env):
+                return {'FileSystemId': results['create_efs']} if efs_manager.efs_folder_setup(client, env) else None
+
+        if not journal.run(client, env, 'efs_folder_setup', step):
+            raise OnboardingError(f"EFS folder setup failed for '{client}' {env}")
+
+    def secret(env, results):
+        def step():
+            secret_name = ensure_client_secret(efs_manager.region, client, env)
+            return {'secret_name': secret_name} if secret_name else None
+
+        resources = journal.run(client, env, 'secret', step)
+        if not resources:
+            raise OnboardingError(f"Secret could not be created for '{client}' {env}")
+        return resources['secret_name']
+
+    def database(env, results):
+        def step():
+            with span('setup_rds', client, env):
+                return provision_database(efs_manager.region, client, env, results[f'secret:{env}'])
+
+        if not journal.run(client, env, 'database', step):
+            raise OnboardingError(f"RDS setup failed for '{client}' {env}")
+
+    graph.add('create_efs', create_efs)
+    graph.add('create_access_points', create_access_points, ['create_efs'])
+    graph.add('mount_efs', mount_efs, ['create_efs'])
+    for env in envs:
+        graph.add(f'efs_folder_setup:{env}', partial(folder_setup, env), ['create_access_points', 'mount_efs'])
+        graph.add(f'secret:{env}', partial(secret, env))
+        graph.add(f'database:{env}', partial(database, env), [f'secret:{env}'])
+    return graph
+
+
+def onboard_client(efs_manager, client, envs, journal=None):
+    """ Onboard every environment of a single client, running independent steps in parallel. """
+    graph = build_client_graph(efs_manager, client, envs, journal)
+    graph.run(max_workers=int(os.environ.get("ONBOARD_TASK_WORKERS", 4)))
+
+
+def run_onboarding(efs_manager, client_envs, max_workers=None, journal=None):
+    """ Onboard clients in parallel and return a {client: {'status', 'envs', 'error', 'duration'}} summary. """
+    if max_workers is None:
+        max_workers = int(os.environ.get("ONBOARD_MAX_WORKERS", 4))
+    max_workers = max(1, min(max_workers, len(client_envs) or 1))
+    logging.info(f"Onboarding {len(client_envs)} client(s) with {max_workers} worker(s)")
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="onboard") as executor:
+        futures = {executor.submit(timed_onboard_client, efs_manager, client, envs, journal): client
+                   for client, envs in client_envs.items()}
+        for future in as_completed(futures):
+            client = futures[future]
+            try:
+                duration = future.result()
+                results[client] = {'status': 'success', 'envs': client_envs[client], 'error': None, 'duration': duration}
+                logging.info(f"Client '{client}' onboarded successfully in {duration:.1f}s")
+            except Exception as e:
+                results[client] = {'status': 'failed', 'envs': client_envs[client], 'error': str(e),
+                                   'duration': getattr(e, 'duration', None)}
+                logging.error(f"Client '{client}' failed to onboard: {e}")
+    return results
+
+
+def timed_onboard_client(efs_manager, client, envs, journal=None):
+    """ onboard_client returning (or attaching to its error) the client wall-clock duration. """
+    start = time.monotonic()
+    try:
+        onboard_client(efs_manager, client, envs, journal)
+    except Exception as e:
+        e.duration = time.monotonic() - start
+        raise
+    return time.monotonic() - start
+
+
+def print_summary(results):
+    failed = [client for client, result in results.items() if result['status'] != 'success']
+    print(json.dumps(results, indent=2))
+    print(f"Onboarded {len(results) - len(failed)}/{len(results)} client(s)")
+    if failed:
+        print(f"Failed clients: {', '.join(sorted(failed))}")
+    return not failed
+
+
+def onboarded_clients(results):
+    """ {client: envs} of the clients that were onboarded successfully. """
+    return {client: result['envs'] for client, result in results.items() if result['status'] == 'success'}
+
+
+def export_onboarded(results):
+    """ Hand the succeeded clients to the next workflow steps as ONBOARDED, even when other clients failed. """
+    onboarded = json.dumps(onboarded_clients(results))
+    github_env = os.environ.get("GITHUB_ENV")
+    if github_env:
+        with open(github_env, 'a') as file:
+            file.write(f"ONBOARDED={onboarded}\n")
+    print(f"Onboarded: {onboarded}")
+
+
+def onboard_region(region, client_envs):
+    """ Onboard the clients of one region and return the per-client summary. """
+    # Initialize the AWS EFS Manager
+    efs_manager = AwsEfsManager(region)
+    journal = OnboardingJournal(region)
+    prefetch_secrets(region, client_envs.keys())
+    try:
+        return run_onboarding(efs_manager, client_envs, journal=journal)
+    finally:
+        journal.close()
+
+
+if __name__ == '__main__':
+    # Usage: python3 scripts/main.py [--dry-run]
+    dry_run = '--dry-run' in sys.argv[1:]
+
+    # print(os.environ)
+    region = os.environ.get("AWS_REGION")
+    region_client_env_data = os.environ.get("TO_ONBOARD")
+
+    # Check if region_client_env_data is not None
+    if region_client_env_data:
+        # Parse the JSON string into a Python dictionary
+        try:
+            client_envs = json.loads(region_client_env_data)
+        except json.JSONDecodeError as e:
+            print(f"Error parsing JSON from TO_ONBOARD: {e}")
+            sys.exit(1)
+
+        if dry_run:
+            for client, envs in client_envs.items():
+                print(build_client_graph(None, client, envs).describe())
+            sys.exit(0)
 
-                if file_system_id:
-                    # Create access point for the EFS
-                    access_point_id = efs_manager.create_access_point(file_system_id, client, env)
-                    print(f"Access Point ID: {access_point_id}")
-                efs_manager.mount_efs(file_system_id, client)
-                efs_manager.efs_folder_setup(client, env)
-                setup_rds_for_environment(client, env)
-                
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON from MY_VAR: {e}")
-else:
-    print("Environment variable MY_VAR is not set or is empty.")
\ No newline at end of file
+        try:
+            results = onboard_region(region, client_envs)
+        finally:
+            write_trace(default_trace_path(region), script='main.py', region=region)
+        export_onboarded(results)
+        if not print_summary(results):
+            sys.exit(1)
+    else:
+        print("Environment variable TO_ONBOARD is not set or is empty.")
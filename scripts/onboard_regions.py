@@ -0,0 +1,73 @@
+import json
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+
+def onboard_region_process(region, client_envs):
+    """ Entry point of a region worker process, the onboarding modules take the region as an argument. """
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - {region} - %(levelname)s - %(message)s')
+
+    from main import onboard_region
+    from telemetry import write_trace, default_trace_path
+    try:
+        return onboard_region(region, client_envs)
+    finally:
+        write_trace(default_trace_path(region), script='onboard_regions.py', region=region)
+
+
+def run_regions(plan, update_config=False):
+    """ Onboard every region of the plan in its own process. Returns {region: per-client summary}. """
+    plan = {region: client_envs for region, client_envs in plan.items() if client_envs}
+    if not plan:
+        logging.info("Nothing to onboard in any region")
+        return {}
+
+    region_results = {}
+    # One single-worker spawn pool per region: a region never runs in a process another region
+    # used before, so its per-process state (AWS clients, connection pools, trace) is always its own
+    context = multiprocessing.get_context("spawn")
+    executors = {region: ProcessPoolExecutor(max_workers=1, mp_context=context) for region in plan}
+    try:
+        futures = {region: executors[region].submit(onboard_region_process, region, client_envs)
+                   for region, client_envs in plan.items()}
+        for region, future in futures.items():
+            try:
+                region_results[region] = future.result()
+            except Exception as e:
+                logging.error(f"Region {region} failed: {e}")
+                region_results[region] = {client: {'status': 'failed', 'envs': envs, 'error': str(e)}
+                                          for client, envs in plan[region].items()}
+    finally:
+        for executor in executors.values():
+            executor.shutdown()
+
+    if update_config:
+        from main import onboarded_clients
+        from update_config import update_yaml_with_clients
+        for region, results in region_results.items():
+            onboarded = onboarded_clients(results)
+            if onboarded:
+                update_yaml_with_clients(region, json.dumps(onboarded))
+    return region_results
+
+
+if __name__ == '__main__':
+    # Usage: python3 scripts/onboard_regions.py [--update-config] [region ...]
+    # The plan is read from ONBOARD_PLAN (output of planner.py) or computed for the given / all regions.
+    from planner import plan_regions
+
+    logging.basicConfig(level=logging.INFO)
+    args = sys.argv[1:]
+    update_config = '--update-config' in args
+    regions = [arg for arg in args if not arg.startswith('--')] or None
+
+    plan_json = os.environ.get("ONBOARD_PLAN")
+    plan = json.loads(plan_json) if plan_json else plan_regions(regions)
+    region_results = run_regions(plan, update_config)
+
+    print(json.dumps(region_results, indent=2))
+    if any(result['status'] != 'success' for results in region_results.values() for result in results.values()):
+        sys.exit(1)
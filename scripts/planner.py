@@ -0,0 +1,25 @@
+import json
+import os
+import sys
+from fetch_new import find_region_changes
+
+CUSTOMERS_DIR = './customers'
+
+
+def discover_regions(customers_dir=CUSTOMERS_DIR):
+    """ Every customers/<region> directory is a region to plan. """
+    return sorted(entry for entry in os.listdir(customers_dir)
+                  if os.path.isdir(os.path.join(customers_dir, entry)))
+
+
+def plan_regions(regions=None, incremental=True):
+    """ Compute the onboarding diff of every region in one pass: {region: {client: [envs]}}. """
+    if regions is None:
+        regions = discover_regions()
+    return {region: find_region_changes(region, incremental) for region in regions}
+
+
+if __name__ == '__main__':
+    # Usage: python3 scripts/planner.py [region ...]  (defaults to every customers/<region>)
+    incremental = os.environ.get("FETCH_INCREMENTAL", "true").lower() != "false"
+    print(json.dumps(plan_regions(sys.argv[1:] or None, incremental)))
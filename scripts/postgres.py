@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import re
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import errors, sql
+from psycopg2.pool import ThreadedConnectionPool
+
+# Owns every object inside the template databases. The template databases themselves are
+# owned by the master user: REASSIGN OWNED also moves the databases a role owns.
+TEMPLATE_OWNER = 'dotcms_template_owner'
+TEMPLATE_PREFIX = 'dotcms_template_'
+
+
+def template_name(dotcms_version):
+    """ Template database of a dotCMS version, e.g. '21.06' -> dotcms_template_21_06. """
+    return TEMPLATE_PREFIX + re.sub(r'\W', '_', str(dotcms_version))
+
+
+class PostgresProvisioner:
+    """
+    Creates client databases and roles over a pooled master connection.
+
+    Works the same against RDS and a local Postgres container, e.g.
+    PostgresProvisioner('localhost', 'postgres', 'postgres', port=5432).
+    Any libpq setting not passed here (PGSSLMODE, PGCONNECT_TIMEOUT, ...) is read from the environment.
+    """
+
+    def __init__(self, host, user, password, port=5432, dbname='postgres', maxconn=4):
+        self.host = host
+        self.connect_args = {'host': host, 'port': port, 'user': user, 'password': password}
+        self.pool = ThreadedConnectionPool(1, maxconn, dbname=dbname, **self.connect_args)
+
+    @contextmanager
+    def connection(self, autocommit=False):
+        """ Borrow a pooled connection. Without autocommit the block runs in one transaction. """
+        conn = self.pool.getconn()
+        try:
+            conn.autocommit = autocommit
+            yield conn
+            if not autocommit:
+                conn.commit()
+        except Exception:
+            if not autocommit:
+                conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    @contextmanager
+    def database_connection(self, dbname):
+        """ Unpooled connection to another database of the server, the block runs in one transaction. """
+        conn = psycopg2.connect(dbname=dbname, **self.connect_args)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def existing_databases(self, names):
+        with self.connection(autocommit=True) as conn, conn.cursor() as cur:
+            cur.execute("SELECT datname FROM pg_database WHERE datname = ANY(%s)", (list(names),))
+            return {row[0] for row in cur.fetchall()}
+
+    def existing_roles(self, names):
+        with self.connection(autocommit=True) as conn, conn.cursor() as cur:
+            cur.execute("SELECT rolname FROM pg_roles WHERE rolname = ANY(%s)", (list(names),))
+            return {row[0] for row in cur.fetchall()}
+
+    def list_databases(self):
+        with self.connection(autocommit=True) as conn, conn.cursor() as cur:
+            cur.execute("SELECT datname FROM pg_database WHERE NOT datistemplate")
+            return {row[0] for row in cur.fetchall()}
+
+    def list_roles(self):
+        with self.connection(autocommit=True) as conn, conn.cursor() as cur:
+            cur.execute("SELECT rolname FROM pg_roles")
+            return {row[0] for row in cur.fetchall()}
+
+    def create_database(self, db_name, template=None):
+        """ Create db_name, cloned from template when given. Falls back to an empty database if the template is missing. """
+        # CREATE DATABASE cannot run inside a transaction block
+        with self.connection(autocommit=True) as conn, conn.cursor() as cur:
+            if template:
+                try:
+                    cur.execute(sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(
+                        sql.Identifier(db_name), sql.Identifier(template)))
+                    logging.info(f"Database {db_name} cloned from {template} on {self.host}")
+                    return True
+                except errors.InvalidCatalogName:
+                    logging.warning(f"Template {template} does not exist on {self.host}, creating {db_name} empty")
+            cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(db_name)))
+        logging.info(f"Database {db_name} created on {self.host}")
+        return False
+
+    def provision(self, db_name, role_name, role_password, template=None):
+        """ Create the database (cloned from template when given) and its owner role if they are missing. Safe to re-run. """
+        if db_name not in self.existing_databases([db_name]):
+            self.create_database(db_name, template)
+        else:
+            logging.info(f"Database {db_name} already exists on {self.host}")
+
+        role_exists = role_name in self.existing_roles([role_name])
+        role = sql.Identifier(role_name)
+        with self.connection() as conn, conn.cursor() as cur:
+            if role_exists:
+                # Keep the role password in sync with the client secret
+                cur.execute(sql.SQL("ALTER ROLE {} WITH LOGIN ENCRYPTED PASSWORD %s").format(role), (role_password,))
+            else:
+                cur.execute(sql.SQL("CREATE ROLE {} WITH LOGIN ENCRYPTED PASSWORD %s").format(role), (role_password,))
+            # On RDS the master user is not a superuser, it has to be a member of the role to hand ownership to it
+            cur.execute(sql.SQL("GRANT {} TO CURRENT_USER").format(role))
+            cur.execute(sql.SQL("GRANT ALL PRIVILEGES ON DATABASE {} TO {}").format(sql.Identifier(db_name), role))
+            cur.execute(sql.SQL("ALTER DATABASE {} OWNER TO {}").format(sql.Identifier(db_name), role))
+        logging.info(f"Role {role_name} {'updated' if role_exists else 'created'} and granted {db_name}")
+
+        if template:
+            self.reassign_template_objects(db_name, role_name)
+
+    def reassign_template_objects(self, db_name, role_name):
+        """ Hand the objects cloned from a template over to the tenant role. A no-op on databases not cloned from one. """
+        if TEMPLATE_OWNER not in self.existing_roles([TEMPLATE_OWNER]):
+            return
+        owner, role = sql.Identifier(TEMPLATE_OWNER), sql.Identifier(role_name)
+        with self.connection() as conn, conn.cursor() as cur:
+            # REASSIGN OWNED needs membership in both roles
+            cur.execute(sql.SQL("GRANT {} TO CURRENT_USER").format(owner))
+        with self.database_connection(db_name) as conn, conn.cursor() as cur:
+            cur.execute(sql.SQL("REASSIGN OWNED BY {} TO {}").format(owner, role))
+            # Nothing is owned by the template owner anymore, this only drops its leftover privileges
+            cur.execute(sql.SQL("DROP OWNED BY {}").format(owner))
+        logging.info(f"Objects of {db_name} reassigned from {TEMPLATE_OWNER} to {role_name}")
+
+    def list_templates(self):
+        """ {template name: {'comment', 'size'}} of the dotCMS template databases. """
+        with self.connection(autocommit=True) as conn, conn.cursor() as cur:
+            cur.execute("SELECT datname, shobj_description(oid, 'pg_database'), pg_database_size(oid) FROM pg_database "
+                        "WHERE datistemplate AND datname LIKE %s", (TEMPLATE_PREFIX + '%',))
+            return {name: {'comment': comment, 'size': size} for name, comment, size in cur.fetchall()}
+
+    def build_template(self, dotcms_version, seed_sql, force=False):
+        """
+        (Re)build the template database of a dotCMS version from a plain SQL seed, owned by TEMPLATE_OWNER.
+        Skipped when the template was already built from the same seed, unless force.
+        The new template is built aside and swapped in by rename, tenants keep being cloned from the old one meanwhile.
+        """
+        name = template_name(dotcms_version)
+        digest = hashlib.sha256(seed_sql.encode()).hexdigest()
+        comment = f"dotcms {dotcms_version} seed sha256:{digest}"
+        existing = self.list_templates().get(name)
+        if existing and existing['comment'] == comment and not force:
+            logging.info(f"Template {name} is up to date")
+            return False
+
+        staging = f"{name}_build"
+        owner = sql.Identifier(TEMPLATE_OWNER)
+        self.drop_template(staging)
+        owner_exists = TEMPLATE_OWNER in self.existing_roles([TEMPLATE_OWNER])
+        with self.connection() as conn, conn.cursor() as cur:
+            if not owner_exists:
+                cur.execute(sql.SQL("CREATE ROLE {} NOLOGIN").format(owner))
+            cur.execute(sql.SQL("GRANT {} TO CURRENT_USER").format(owner))
+        with self.connection(autocommit=True) as conn, conn.cursor() as cur:
+            # template0 carries none of the objects that may have been added to template1
+            cur.execute(sql.SQL("CREATE DATABASE {} TEMPLATE template0").format(sql.Identifier(staging)))
+        with self.database_connection(staging) as conn, conn.cursor() as cur:
+            cur.execute(sql.SQL("GRANT CREATE ON SCHEMA public TO {}").format(owner))
+            cur.execute(sql.SQL("SET ROLE {}").format(owner))
+            cur.execute(seed_sql)
+
+        retired = f"{name}_old"
+        self.drop_template(retired)
+        staging_db, template_db, retired_db = sql.Identifier(staging), sql.Identifier(name), sql.Identifier(retired)
+        # Renames are transactional: tenants cloned meanwhile see either the old or the new template, never none
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(sql.SQL("COMMENT ON DATABASE {} IS {}").format(staging_db, sql.Literal(comment)))
+            # No one can connect to it (which would block cloning), only CREATE DATABASE ... TEMPLATE can use it
+            cur.execute(sql.SQL("ALTER DATABASE {} WITH IS_TEMPLATE true ALLOW_CONNECTIONS false").format(staging_db))
+            if existing:
+                cur.execute(sql.SQL("ALTER DATABASE {} RENAME TO {}").format(template_db, retired_db))
+            cur.execute(sql.SQL("ALTER DATABASE {} RENAME TO {}").format(staging_db, template_db))
+        self.drop_template(retired)
+        logging.info(f"Template {name} built for dotCMS {dotcms_version} on {self.host}")
+        return True
+
+    def drop_template(self, name):
+        if name not in self.existing_databases([name]):
+            return
+        with self.connection(autocommit=True) as conn, conn.cursor() as cur:
+            database = sql.Identifier(name)
+            cur.execute(sql.SQL("ALTER DATABASE {} WITH IS_TEMPLATE false").format(database))
+            cur.execute(sql.SQL("DROP DATABASE {}").format(database))
+        logging.info(f"Template {name} dropped on {self.host}")
+
+    def close(self):
+        self.pool.closeall()
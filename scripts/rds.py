@@ -1,54 +1,114 @@
-import boto3
 import random
 import string
 import json
 import os
 import logging
-import time
-import subprocess
-from secrets import AWSSecretManager
-
-region = os.environ.get("AWS_REGION")
-aws_secret_manager = AWSSecretManager(region)
-regions = {
-            'ca-central-1': {"rds_endpoint": "rds-dsantos.cfv6lwb0lbi7.ca-central-1.rds.amazonaws.com", "master_password": "master_password"},
-            'us-east-1': {"subnet_ids": ["subnet-088928fa05998da0a"], "security_groups":["sg-04e82704b331280ed"]},
-            'us-east-2': {"subnet_ids": ["id_a","id_b"], "security_groups":["a","b"]},
-            'ap-south-2': {"subnet_ids": ["id_a","id_b"], "security_groups":["a","b"]}
-          }
-
-def setup_rds_for_environment(client_name, env):
-    
+import threading
+from functools import lru_cache
+import psycopg2
+from secrets import CachedSecretManager
+from fetch_new import read_yaml_files
+from postgres import PostgresProvisioner, template_name
+from throttle import service_limit, service_slot
+from telemetry import span
+from regions import get_region_config
+
+# 'empty' creates empty databases that dotCMS initialises on first boot, 'template' clones the
+# template database of the env dotcms_version (see scripts/db_templates.py)
+PROVISIONING_MODE = os.environ.get("RDS_PROVISIONING_MODE", "empty")
+CUSTOMERS_DIR = './customers'
+# One secret manager per region, created on first use so importing this module never sets up an AWS client
+_secret_managers = {}
+_secret_manager_lock = threading.Lock()
+
+
+def get_secret_manager(region):
+    """ Return the run-wide secret manager of the region. """
+    with _secret_manager_lock:
+        if region not in _secret_managers:
+            _secret_managers[region] = CachedSecretManager(region)
+        return _secret_managers[region]
+
+
+def prefetch_secrets(region, client_names):
+    """ Load the master secret and the known client secrets in as few calls as possible. """
+    secret_manager = get_secret_manager(region)
+    master_secret_name = get_region_config(region).get('master_password')
+    secret_manager.prefetch([master_secret_name] + [secret_manager.client_secret_name(c) for c in client_names])
+
+
+# One master connection pool per region, shared by every client and env of the run
+_provisioners = {}
+_provisioner_lock = threading.Lock()
+
+
+def get_provisioner(region):
+    """ Return the run-wide Postgres provisioner of the region, connecting with the master secret on first use. """
+    with _provisioner_lock:
+        if region not in _provisioners:
+            # Retrieve master admin RDS secret from Secret Manager
+            master_secret_values = get_secret_manager(region).get_secret_values(get_region_config(region).get('master_password'))
+            if not master_secret_values:
+                raise ValueError(f"No RDS master secret found for region {region}")
+            rds_endpoint = os.environ.get("RDS_ENDPOINT") or get_region_config(region).get('rds_endpoint')
+            _provisioners[region] = PostgresProvisioner(
+                rds_endpoint,
+                master_secret_values['username'],
+                master_secret_values['password'],
+                port=int(os.environ.get("RDS_PORT", 5432)),
+                maxconn=service_limit('postgres')
+            )
+        return _provisioners[region]
+
+
+@lru_cache(maxsize=None)
+def customer_specs(region):
+    """ {client: {env: spec}} of customers/<region>/*.yaml, read once per run. """
+    return {client: envs for data in read_yaml_files(os.path.join(CUSTOMERS_DIR, region))
+            for client, envs in (data or {}).items()}
+
+
+def database_template(region, client_name, env):
+    """ Template database to clone for the env, None to create it empty. """
+    if PROVISIONING_MODE != 'template':
+        return None
+    version = ((customer_specs(region).get(client_name) or {}).get(env) or {}).get('dotcms_version')
+    if not version:
+        logging.warning(f"No dotcms_version for {client_name} {env}, its database will be created empty")
+        return None
+    return template_name(version)
+
+
+def ensure_client_secret(region, client_name, env):
+    """ Make sure the client secret holds the database password of the env. Returns the secret name, None on failure. """
     service = "db"
-    # Retrieve master admin RDS secret from Secret Manager
-    master_secret_values = aws_secret_manager.get_secret_values(regions.get(region, {}).get('master_password'))
-    db_master_user = master_secret_values['username']
-    db_master_password = master_secret_values['password']
-    
-    print(db_master_user, db_master_password)
-    # Check for existing client secret | create a new secret and secret values 
-    secret_name = aws_secret_manager.create_or_update_secret(client_name, env, service)
-    time.sleep(10)  # Wait for the secret to be available
-    client_secret_values = aws_secret_manager.get_secret_values(secret_name)
-    
+    # Check for existing client secret | create a new secret and secret values
+    with span('secret', client_name, env):
+        return get_secret_manager(region).create_or_update_secret(client_name, env, service)
+
+
+def provision_database(region, client_name, env, secret_name):
+    """ Create the database and role of an env with the password of the client secret. Returns the resources, None on failure. """
+    # Values we just wrote are served from the cache, no need to wait for the secret to be readable
+    client_secret_values = get_secret_manager(region).get_secret_values(secret_name)
+
     db_name = f'{client_name}_{env}_db'
     role_name = f'{client_name}_{env}_db_user'
-    role_password = client_secret_values[role_name]
-    rds_endpoint = regions.get(region, {}).get('rds_endpoint')
-    
-    createdb = f"export PGPASSWORD={db_master_password} && psql -h {rds_endpoint} -U {db_master_user} -c \"CREATE DATABASE {db_name};\""
-    createrole = f"export PGPASSWORD={db_master_password} && psql -h {rds_endpoint} -U {db_master_user} -c \"CREATE ROLE {role_name} WITH LOGIN ENCRYPTED PASSWORD '{role_password}';\""
-    grantrole = f"export PGPASSWORD={db_master_password} && psql -h {rds_endpoint} -U {db_master_user} -c \"GRANT ALL PRIVILEGES ON DATABASE {db_name} TO {role_name};\""
-    alterdb = f"export PGPASSWORD={db_master_password} && psql -h {rds_endpoint} -U {db_master_user} -c \"ALTER DATABASE {db_name} OWNER TO {role_name};\" && unset PGPASSWORD"
-    checkdb = f"export PGPASSWORD={db_master_password} && psql -h {rds_endpoint} -U {db_master_user} -c \"\\l\" && unset PGPASSWORD"
-    
-    # Execute the command
+
     try:
-        subprocess.run(createdb, check=True, shell=True)
-        subprocess.run(createrole, check=True, shell=True)
-        subprocess.run(grantrole, check=True, shell=True)
-        subprocess.run(alterdb, check=True, shell=True)
-        subprocess.run(checkdb, check=True, shell=True)
+        role_password = client_secret_values[role_name]
+        with service_slot('postgres'), span('provision_database', client_name, env):
+            get_provisioner(region).provision(db_name, role_name, role_password, database_template(region, client_name, env))
         logging.info(f"Database {db_name}, role {role_name}, and permissions have been set up for {client_name} {env}")
-    except subprocess.CalledProcessError as e:
+        return {'secret_name': secret_name, 'database': db_name, 'role': role_name}
+    except (psycopg2.Error, ValueError, KeyError, TypeError) as e:
         logging.error(f"Error setting up RDS for {client_name} {env}: {e}")
+        return None
+
+
+def setup_rds_for_environment(region, client_name, env):
+    """ Create the client secret key, database and role of an env. Returns the resources created, None on failure. """
+    secret_name = ensure_client_secret(region, client_name, env)
+    if not secret_name:
+        return None
+    return provision_database(region, client_name, env, secret_name)
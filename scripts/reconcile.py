@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import sys
+from fetch_new import CACHE_DIR, read_customer_envs
+from telemetry import span, tracer
+from waiter import describe_all_file_systems
+
+CLIENT_TAG = 'dotcms.client.name.short'
+
+
+def sweep_access_points(efs_client):
+    """ Every access point of the region (no FileSystemId filter), grouped by file system. """
+    by_file_system = {}
+    kwargs = {}
+    while True:
+        response = efs_client.describe_access_points(**kwargs)
+        for ap in response.get('AccessPoints', []):
+            by_file_system.setdefault(ap['FileSystemId'], []).append(ap)
+        if not response.get('NextToken'):
+            return by_file_system
+        kwargs['NextToken'] = response['NextToken']
+
+
+def sweep_secret_names(secrets_client):
+    names = set()
+    paginator = secrets_client.get_paginator('list_secrets')
+    for page in paginator.paginate():
+        names.update(secret['Name'] for secret in page.get('SecretList', []))
+    return names
+
+
+def tags_of(resource):
+    return {tag.get('Key'): tag.get('Value') for tag in resource.get('Tags', [])}
+
+
+def collect_inventory(efs_manager, secret_manager, provisioner, desired):
+    """ One paginated sweep per service. Mount targets come from NumberOfMountTargets, no per file system call. """
+    inventory = {}
+    with span('sweep_file_systems'):
+        inventory['file_systems'] = {}
+        for fs in describe_all_file_systems(efs_manager.efs_client):
+            client = tags_of(fs).get(CLIENT_TAG)
+            if client:
+                inventory['file_systems'][client] = fs
+    with span('sweep_access_points'):
+        inventory['access_points'] = sweep_access_points(efs_manager.efs_client)
+    with span('sweep_secrets'):
+        inventory['secret_names'] = sweep_secret_names(secret_manager.secrets_client)
+        # Values are only needed for the secrets of desired clients, 20 per batch call
+        secret_manager.prefetch([secret_manager.client_secret_name(client) for client in desired
+                                 if secret_manager.client_secret_name(client) in inventory['secret_names']])
+    if provisioner:
+        with span('sweep_postgres'):
+            inventory['databases'] = provisioner.list_databases()
+            inventory['roles'] = provisioner.list_roles()
+    return inventory
+
+
+def reconcile(desired, inventory, secret_manager, expected_mount_targets):
+    """ Join the desired {client: [envs]} with the inventory. Returns the drift report. """
+    check_postgres = 'databases' in inventory
+    tenants = {}
+    for client, envs in sorted(desired.items()):
+        fs = inventory['file_systems'].get(client)
+        access_points = {tags_of(ap).get('Name') for ap in inventory['access_points'].get(fs['FileSystemId'], [])} if fs else set()
+        secret_name = secret_manager.client_secret_name(client)
+        secret = (secret_manager.get_secret_values(secret_name) or {}) if secret_name in inventory['secret_names'] else {}
+
+        client_checks = {
+            'efs': fs is not None and fs.get('LifeCycleState') == 'available',
+            'mount_targets': fs is not None and fs.get('NumberOfMountTargets', 0) >= expected_mount_targets,
+        }
+        env_checks = {}
+        for env in envs:
+            checks = {
+                'access_point': env in access_points,
+                'secret_key': f"{client}_{env}_db_user" in secret,
+            }
+            if check_postgres:
+                checks['database'] = f"{client}_{env}_db" in inventory['databases']
+                checks['role'] = f"{client}_{env}_db_user" in inventory['roles']
+            env_checks[env] = checks
+
+        results = list(client_checks.values()) + [ok for checks in env_checks.values() for ok in checks.values()]
+        status = 'ok' if all(results) else 'missing' if not any(results) else 'partial'
+        tenants[client] = {'status': status, 'client': client_checks, 'envs': env_checks}
+
+    desired_envs = {(client, env) for client, envs in desired.items() for env in envs}
+    orphaned = {
+        'file_systems': sorted(f"{client} ({fs['FileSystemId']})" for client, fs in inventory['file_systems'].items()
+                               if client not in desired),
+        'access_points': sorted(f"{client}/{tags_of(ap).get('Name')} ({ap['AccessPointId']})"
+                                for client, fs in inventory['file_systems'].items() if client in desired
+                                for ap in inventory['access_points'].get(fs['FileSystemId'], [])
+                                if (client, tags_of(ap).get('Name')) not in desired_envs),
+        'secrets': sorted(name for name in inventory['secret_names']
+                          if name.endswith('_secrets') and name[:-len('_secrets')] not in desired),
+    }
+    if check_postgres:
+        desired_dbs = {f"{client}_{env}_db" for client, env in desired_envs}
+        orphaned['databases'] = sorted(db for db in inventory['databases'] if db.endswith('_db') and db not in desired_dbs)
+
+    return {
+        'summary': {status: sum(1 for t in tenants.values() if t['status'] == status) for status in ('ok', 'partial', 'missing')},
+        'tenants': {client: tenant for client, tenant in tenants.items() if tenant['status'] != 'ok'},
+        'orphaned': orphaned,
+    }
+
+
+if __name__ == '__main__':
+    # Usage: python3 scripts/reconcile.py [--skip-postgres]
+    import rds
+    from efs import AwsEfsManager
+    from regions import get_region_config
+
+    logging.basicConfig(level=logging.INFO)
+    region = os.environ.get("AWS_REGION")
+    skip_postgres = '--skip-postgres' in sys.argv[1:]
+
+    desired = read_customer_envs(f'./customers/{region}/', os.path.join(CACHE_DIR, f"manifest-{region}.json"))
+    efs_manager = AwsEfsManager(region)
+    provisioner = None if skip_postgres else rds.get_provisioner(region)
+
+    secret_manager = rds.get_secret_manager(region)
+    inventory = collect_inventory(efs_manager, secret_manager, provisioner, desired)
+    expected_mount_targets = len(get_region_config(region).get('subnet_ids', []))
+    report = reconcile(desired, inventory, secret_manager, expected_mount_targets)
+    report['api_calls'] = {op: counters['calls'] for op, counters in tracer.to_dict()['api_calls'].items()}
+
+    print(json.dumps(report, indent=2))
+    if report['tenants'] or any(report['orphaned'].values()):
+        sys.exit(1)
@@ -0,0 +1,18 @@
+# Settings of every region we onboard into, shared by the EFS and RDS setup
+REGIONS = {
+    'ca-central-1': {
+        "subnet_ids": ["subnet-06f45035183d72a63"],  # AZ MUST BE DIFFERENT FOR EFS MOUNT TARGET
+        "security_groups": ["sg-084bfe2d8728356fe"],
+        "glowroot": "http://glowrootcentral.dotcmscloud.com:8181",
+        "rds_endpoint": "rds-dsantos.cfv6lwb0lbi7.ca-central-1.rds.amazonaws.com",
+        "master_password": "master_password",
+    },
+    'us-east-1': {"subnet_ids": ["subnet-088928fa05998da0a"], "security_groups": ["sg-04e82704b331280ed"]},
+    'us-east-2': {"subnet_ids": ["id_a", "id_b"], "security_groups": ["a", "b"]},
+    'ap-south-2': {"subnet_ids": ["id_a", "id_b"], "security_groups": ["a", "b"]},
+}
+
+
+def get_region_config(region):
+    """ Settings of the region, an empty dict when the region is unknown. """
+    return REGIONS.get(region, {})
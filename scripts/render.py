@@ -0,0 +1,184 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import string
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import yaml
+from fetch_new import YamlLoader, read_yaml_files
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'templates', 'k8s')
+PLACEHOLDER = re.compile(r"\$\{(\w+)\}")
+
+# ClusterSecretStore of the External Secrets Operator that reads the region Secrets Manager
+SECRET_STORE = os.environ.get("RENDER_SECRET_STORE", "aws-secrets-manager")
+# Below this many envs, rendering in worker processes costs more than it saves
+PARALLEL_THRESHOLD = 50
+
+
+@lru_cache(maxsize=None)
+def load_templates(template_dir=TEMPLATE_DIR):
+    """ Parse the manifest templates once per process. Returns (documents, digest of the template sources). """
+    documents = []
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(template_dir, '*.yaml'))):
+        with open(path, 'rb') as file:
+            content = file.read()
+        digest.update(content)
+        documents.extend(doc for doc in yaml.load_all(content, Loader=YamlLoader) if doc)
+    return documents, digest.hexdigest()
+
+
+def substitute(node, values):
+    """ Fill ${name} placeholders. A value that is a whole placeholder keeps its type (lists, dicts, ints). """
+    if isinstance(node, dict):
+        return {substitute(key, values): substitute(value, values) for key, value in node.items()}
+    if isinstance(node, list):
+        return [substitute(item, values) for item in node]
+    if isinstance(node, str):
+        match = PLACEHOLDER.fullmatch(node)
+        if match:
+            return values[match.group(1)]
+        return string.Template(node).substitute(values)
+    return node
+
+
+def manifest_values(region, client, env, spec, resources, rds_endpoint):
+    alb = spec.get('alb_specs', {})
+    stateful_set = spec['stateful_set_specs']
+    storage = f"{spec.get('volumes_specs', {}).get('pv_storage_capacity', 30)}Gi"
+
+    requests = {'cpu': str(stateful_set['cpu']), 'memory': str(stateful_set['memory'])}
+    if stateful_set.get('ephemeral-storage'):
+        requests['ephemeral-storage'] = f"{stateful_set['ephemeral-storage']}Gi"
+    limits = {'cpu': str(stateful_set.get('cpu_limit', stateful_set['cpu'])),
+              'memory': str(stateful_set.get('memory_limit', stateful_set['memory']))}
+
+    annotations = {
+        'alb.ingress.kubernetes.io/scheme': 'internet-facing',
+        'alb.ingress.kubernetes.io/target-type': 'ip',
+    }
+    if alb.get('certificates'):
+        annotations['alb.ingress.kubernetes.io/certificate-arn'] = ','.join(alb['certificates'])
+        annotations['alb.ingress.kubernetes.io/listen-ports'] = '[{"HTTP": 80}, {"HTTPS": 443}]'
+    waf = [arn for arn in alb.get('waf', []) if arn != 'none']
+    if waf:
+        annotations['alb.ingress.kubernetes.io/wafv2-acl-arn'] = waf[0]
+
+    name = f"{client}-{env}"
+    return {
+        'region': region,
+        'client': client,
+        'env': env,
+        'name': name,
+        'namespace': spec.get('namespace', client),
+        'storage': storage,
+        'volume_handle': f"{resources['FileSystemId']}::{resources['AccessPointId']}",
+        'replicas': int(alb.get('replicas', 1)),
+        'image': stateful_set['image'],
+        'resources': {'requests': requests, 'limits': limits},
+        'rds_endpoint': rds_endpoint,
+        'database': f"{client}_{env}_db",
+        'db_user': f"{client}_{env}_db_user",
+        'secret_store': SECRET_STORE,
+        'ingress_annotations': annotations,
+        'ingress_rules': [{'host': host, 'http': {'paths': [{
+            'path': '/', 'pathType': 'Prefix',
+            'backend': {'service': {'name': name, 'port': {'number': 8082}}}}]}}
+            for host in alb.get('hosts', [])],
+    }
+
+
+def render_env(job):
+    """ Render the manifests of one env. job is (region, client, env, spec, resources, rds_endpoint). """
+    documents, _ = load_templates()
+    values = manifest_values(*job)
+    return yaml.safe_dump_all([substitute(doc, values) for doc in documents], sort_keys=False)
+
+
+def content_key(job):
+    """ Address of the rendered output: changes when the spec, the resource ids or the templates change. """
+    _, templates_digest = load_templates()
+    payload = json.dumps({'job': job, 'templates': templates_digest, 'secret_store': SECRET_STORE},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def render_region(region, customers, resources_of, out_dir, rds_endpoint, workers=None):
+    """
+    Render every client/env of the customer specs into out_dir/<region>/<client>/<env>.yaml.
+    Only envs whose content key changed since the last render are rendered and written.
+    resources_of(client, env) returns {'FileSystemId', 'AccessPointId'} or None.
+    """
+    region_dir = os.path.join(out_dir, region)
+    index_path = os.path.join(region_dir, 'index.json')
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as file:
+            index = json.load(file)
+
+    jobs = {}
+    for client, envs in customers.items():
+        for env, spec in (envs or {}).items():
+            if not spec or 'stateful_set_specs' not in spec:
+                logging.warning(f"No stateful_set_specs for {client} {env}, skipping")
+                continue
+            resources = resources_of(client, env)
+            if not resources:
+                logging.warning(f"No EFS or access point found for {client} {env} (not onboarded yet?), skipping")
+                continue
+            job = (region, client, env, spec, resources, rds_endpoint)
+            key = content_key(job)
+            path = os.path.join(region_dir, client, f"{env}.yaml")
+            if index.get(f"{client}/{env}") == key and os.path.exists(path):
+                continue
+            jobs[(client, env, key, path)] = job
+
+    if len(jobs) >= PARALLEL_THRESHOLD:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rendered = list(executor.map(render_env, jobs.values(), chunksize=16))
+    else:
+        rendered = [render_env(job) for job in jobs.values()]
+
+    for (client, env, key, path), manifest in zip(jobs, rendered):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(manifest)
+        index[f"{client}/{env}"] = key
+
+    os.makedirs(region_dir, exist_ok=True)
+    with open(index_path, 'w') as file:
+        json.dump(index, file, indent=2, sort_keys=True)
+    logging.info(f"Rendered {len(jobs)} env(s) for {region}, the others were up to date")
+    return [path for _, _, _, path in jobs]
+
+
+if __name__ == '__main__':
+    # Usage: python3 scripts/render.py [out_dir]  (defaults to ./manifests)
+    from efs import AwsEfsManager
+    from regions import get_region_config
+
+    logging.basicConfig(level=logging.INFO)
+    region = os.environ.get("AWS_REGION")
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else './manifests'
+
+    customers = {k: v for d in read_yaml_files(f'./customers/{region}/') for k, v in (d or {}).items()}
+    # Ids come from AWS (one file system sweep, one access point listing per client), so every onboarded
+    # tenant renders whichever runner onboarded it
+    efs_manager = AwsEfsManager(region)
+
+    def resources_of(client, env):
+        file_system_id = efs_manager.inventory.lookup(f"{client}-k8s")
+        access_point_id = file_system_id and efs_manager.access_points.get(file_system_id, env)
+        if not access_point_id:
+            return None
+        return {'FileSystemId': file_system_id, 'AccessPointId': access_point_id}
+
+    rds_endpoint = os.environ.get("RDS_ENDPOINT") or get_region_config(region).get('rds_endpoint')
+    workers = int(os.environ.get("RENDER_WORKERS", 0)) or None
+    for path in render_region(region, customers, resources_of, out_dir, rds_endpoint, workers):
+        print(path)
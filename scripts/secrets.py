@@ -1,13 +1,16 @@
-import boto3
 import random
 import string
 import json
 import logging
+import threading
+from collections import defaultdict
+from aws import get_client
+from throttle import ThrottledClient
 
 
 class AWSSecretManager:
-    def __init__(self, region):
-        self.secrets_client = boto3.client('secretsmanager', region_name=region)
+    def __init__(self, region, secrets_client=None):
+        self.secrets_client = ThrottledClient(secrets_client or get_client('secretsmanager', region), 'secretsmanager')
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
     def log_error(self, e):
@@ -27,8 +30,15 @@ class AWSSecretManager:
             logging.error(f"Secret : {secret_name} does not exist")
             return None
 
+    def client_secret_name(self, client_name):
+        return f"{client_name}_secrets"
+
+    def _secret_written(self, secret_name, secret):
+        """ Called with the full secret after it was created or updated. """
+        pass
+
     def create_or_update_secret(self, client_name, env, service):
-        secret_name = f"{client_name}_secrets"
+        secret_name = self.client_secret_name(client_name)
         new_key = f"{client_name}_{env}_{service}_user"
 
         try:
@@ -37,6 +47,7 @@ class AWSSecretManager:
                 # Secret does not exist, create it
                 secret = {new_key: self.generate_random_password(14)}
                 self.secrets_client.create_secret(Name=secret_name, SecretString=json.dumps(secret))
+                self._secret_written(secret_name, secret)
                 logging.info(f"Created new secret '{secret_name}' with key '{new_key}'.")
             else:
                 # Secret exists, update it if necessary
@@ -44,6 +55,7 @@ class AWSSecretManager:
                 if new_key not in secret:
                     secret[new_key] = self.generate_random_password(14)
                     self.secrets_client.update_secret(SecretId=secret_name, SecretString=json.dumps(secret))
+                    self._secret_written(secret_name, secret)
                     logging.info(f"Updated secret '{secret_name}' with new key '{new_key}'.")
                 else:
                     logging.info(f"Key '{new_key}' already exists in secret '{secret_name}'. No update performed.")
@@ -52,4 +64,68 @@ class AWSSecretManager:
 
         except Exception as e:
             logging.error(f"Error handling the secret: {e}")
-            return None
\ No newline at end of file
+            return None
+
+
+class CachedSecretManager(AWSSecretManager):
+    """
+    AWSSecretManager that keeps every secret read or written during the run in memory,
+    so a secret we just wrote is read back without another round trip.
+    """
+
+    # Max number of secret ids accepted by a single batch_get_secret_value call
+    BATCH_SIZE = 20
+
+    def __init__(self, region, secrets_client=None):
+        super().__init__(region, secrets_client)
+        self._cache = {}
+        self._missing = set()
+        self._lock = threading.Lock()
+        self._secret_locks = defaultdict(threading.Lock)
+
+    def prefetch(self, secret_names):
+        """ Load the given secrets with batch_get_secret_value, 20 per call. Unknown names are remembered as missing. """
+        with self._lock:
+            pending = [name for name in dict.fromkeys(secret_names)
+                       if name and name not in self._cache and name not in self._missing]
+
+        for i in range(0, len(pending), self.BATCH_SIZE):
+            chunk = pending[i:i + self.BATCH_SIZE]
+            try:
+                response = self.secrets_client.batch_get_secret_value(SecretIdList=chunk)
+            except Exception as e:
+                # Older boto3 / missing secretsmanager:BatchGetSecretValue permission: load lazily instead
+                logging.warning(f"Batch secret fetch failed, secrets will be read one by one: {e}")
+                return
+            with self._lock:
+                for value in response.get('SecretValues', []):
+                    self._cache[value['Name']] = json.loads(value['SecretString'])
+                for error in response.get('Errors', []):
+                    if error.get('ErrorCode') == 'ResourceNotFoundException':
+                        self._missing.add(error['SecretId'])
+        logging.info(f"Prefetched {len(pending)} secret(s)")
+
+    def get_secret_values(self, secret_name):
+        with self._lock:
+            if secret_name in self._cache:
+                return dict(self._cache[secret_name])
+            if secret_name in self._missing:
+                return None
+        values = super().get_secret_values(secret_name)
+        if values is not None:
+            with self._lock:
+                self._cache[secret_name] = values
+            return dict(values)
+        return None
+
+    def _secret_written(self, secret_name, secret):
+        with self._lock:
+            self._cache[secret_name] = dict(secret)
+            self._missing.discard(secret_name)
+
+    def create_or_update_secret(self, client_name, env, service):
+        # Envs of the same client update the same secret, serialize them to not lose a key
+        with self._lock:
+            secret_lock = self._secret_locks[self.client_secret_name(client_name)]
+        with secret_lock:
+            return super().create_or_update_secret(client_name, env, service)
@@ -0,0 +1,96 @@
+import grp
+import logging
+import os
+import pwd
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Every file operation on EFS is a network round trip, copy many files at once to hide the latency
+DEFAULT_COPY_WORKERS = int(os.environ.get("EFS_COPY_WORKERS", 16))
+
+
+def _chown(path, uid, gid):
+    if uid is not None:
+        os.lchown(path, uid, gid)
+
+
+def _copy_file(src, dst, uid, gid):
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+    else:
+        shutil.copyfile(src, dst)
+        shutil.copymode(src, dst)
+    _chown(dst, uid, gid)
+
+
+def make_dirs(path, uid=None, gid=None):
+    """ mkdir -p that sets the ownership of every directory it creates. """
+    missing = []
+    while path and not os.path.exists(path):
+        missing.append(path)
+        path = os.path.dirname(path)
+    for directory in reversed(missing):
+        os.mkdir(directory)
+        _chown(directory, uid, gid)
+
+
+def copy_tree(src, dst, uid=None, gid=None, workers=DEFAULT_COPY_WORKERS):
+    """
+    Copy the src tree into dst (which must not exist), setting ownership as each entry is written
+    so no recursive chown pass is needed afterwards. Directories are created first, files are then
+    copied in parallel. Returns the number of files copied.
+    """
+    files = []
+    for root, dirs, filenames in os.walk(src):
+        target_root = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target_root)
+        shutil.copymode(root, target_root)
+        _chown(target_root, uid, gid)
+        for name in filenames + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+            files.append((os.path.join(root, name), os.path.join(target_root, name)))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() re-raises the first copy error
+        list(executor.map(lambda pair: _copy_file(*pair, uid, gid), files))
+    return len(files)
+
+
+def write_file(path, content, uid=None, gid=None):
+    with open(path, 'w') as file:
+        file.write(content)
+    _chown(path, uid, gid)
+
+
+def seed_env_tree(env_path, template_path, glowroot_properties, uid=None, gid=None, workers=DEFAULT_COPY_WORKERS):
+    """
+    Seed an env directory of a client EFS:
+      <env_path>/glowroot (copy of template_path) with its glowroot.properties
+      <env_path>/assets
+    Everything created is owned by uid:gid (ownership is left untouched when uid is None).
+    assets is created last, so its presence means the env was fully seeded.
+    """
+    assets_path = os.path.join(env_path, 'assets')
+    glowroot_path = os.path.join(env_path, 'glowroot')
+    staging_path = f"{glowroot_path}.seeding"
+
+    make_dirs(env_path, uid, gid)
+    # Leftovers of an interrupted seeding are ours, start over
+    for path in (staging_path, glowroot_path):
+        if os.path.lexists(path):
+            shutil.rmtree(path)
+
+    copied = copy_tree(template_path, staging_path, uid, gid, workers)
+    write_file(os.path.join(staging_path, 'glowroot.properties'), glowroot_properties, uid, gid)
+    os.rename(staging_path, glowroot_path)
+    make_dirs(assets_path, uid, gid)
+    logging.info(f"Seeded {env_path} with {copied} glowroot file(s)")
+    return copied
+
+
+if __name__ == '__main__':
+    # Usage: sudo python3 scripts/seeding.py <env_path> <template_path> <owner> <group> < glowroot.properties
+    # Lets runners without root seed natively (parallel copy, ownership set at write time) in one sudo call
+    logging.basicConfig(level=logging.INFO)
+    env_path, template_path, owner, group = sys.argv[1:5]
+    seed_env_tree(env_path, template_path, sys.stdin.read(), pwd.getpwnam(owner).pw_uid, grp.getgrnam(group).gr_gid)
@@ -0,0 +1,167 @@
+import fcntl
+import hashlib
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import yaml
+from fetch_new import CACHE_DIR, YamlLoader
+
+# 'yaml' reads and rewrites config/<region>.yaml directly, 'sqlite' keeps an indexed store
+# that is synced from the YAML when it changes and exports back to it
+STATE_BACKEND = os.environ.get("ONBOARDING_STATE_BACKEND", "yaml")
+
+
+def default_store_path():
+    return os.environ.get("ONBOARDING_STATE_DB", os.path.join(CACHE_DIR, "state.sqlite"))
+
+
+@contextmanager
+def file_lock(path):
+    """ Exclusive lock shared by every runner process writing path on this host. """
+    # Kept out of the repository so the workflow never commits it
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(os.path.join(CACHE_DIR, f"{os.path.basename(path)}.lock"), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_yaml_atomic(path, data):
+    """ Write to a temporary file and rename it over path, readers never see a half written file. """
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w') as file:
+        yaml.dump(data, file)
+    os.replace(tmp_path, path)
+
+
+def read_onboarded_yaml(yaml_path):
+    if not os.path.exists(yaml_path):
+        return {}
+    with open(yaml_path, 'r') as file:
+        return yaml.load(file, Loader=YamlLoader) or {}
+
+
+class OnboardingStateStore:
+    """
+    Indexed (region, client, env) store of the onboarded environments.
+
+    config/<region>.yaml stays the committed source of truth: it is imported whenever its
+    content hash changes, and exported back after every upsert.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_store_path()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS onboarded (
+                region TEXT NOT NULL,
+                client TEXT NOT NULL,
+                env TEXT NOT NULL,
+                onboarded_at TEXT NOT NULL,
+                PRIMARY KEY (region, client, env)
+            );
+            CREATE TABLE IF NOT EXISTS yaml_sync (
+                region TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL
+            );
+        """)
+
+    @contextmanager
+    def transaction(self):
+        # IMMEDIATE takes the write lock up front, concurrent writers wait instead of failing mid-way
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _upsert(self, conn, region, client_envs):
+        now = datetime.now(timezone.utc).isoformat()
+        conn.executemany(
+            "INSERT OR IGNORE INTO onboarded (region, client, env, onboarded_at) VALUES (?, ?, ?, ?)",
+            [(region, client, env, now) for client, envs in client_envs.items() for env in envs or []])
+
+    def sync_from_yaml(self, region, yaml_path):
+        """ Replace the region rows with config/<region>.yaml if it changed since the last import. """
+        if not os.path.exists(yaml_path):
+            return
+        with open(yaml_path, 'rb') as file:
+            content = file.read()
+        digest = hashlib.sha256(content).hexdigest()
+        row = self._conn.execute("SELECT sha256 FROM yaml_sync WHERE region = ?", (region,)).fetchone()
+        if row and row[0] == digest:
+            return
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM onboarded WHERE region = ?", (region,))
+            self._upsert(conn, region, yaml.load(content, Loader=YamlLoader) or {})
+            conn.execute("INSERT OR REPLACE INTO yaml_sync (region, sha256) VALUES (?, ?)", (region, digest))
+        logging.info(f"Imported {yaml_path} into the state store")
+
+    def onboarded(self, region):
+        """ {client: set(envs)} of the region. """
+        onboarded = {}
+        for client, env in self._conn.execute("SELECT client, env FROM onboarded WHERE region = ?", (region,)):
+            onboarded.setdefault(client, set()).add(env)
+        return onboarded
+
+    def upsert(self, region, client_envs):
+        with self.transaction() as conn:
+            self._upsert(conn, region, client_envs)
+
+    def export_yaml(self, region, yaml_path):
+        data = {}
+        for client, env in self._conn.execute(
+                "SELECT client, env FROM onboarded WHERE region = ? ORDER BY client, onboarded_at, rowid", (region,)):
+            data.setdefault(client, []).append(env)
+        write_yaml_atomic(yaml_path, data)
+        with open(yaml_path, 'rb') as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+        self._conn.execute("INSERT OR REPLACE INTO yaml_sync (region, sha256) VALUES (?, ?)", (region, digest))
+
+    def close(self):
+        self._conn.close()
+
+
+def load_onboarded(region, yaml_path):
+    """ {client: set(envs)} already onboarded in the region, from the configured backend. """
+    if STATE_BACKEND == 'sqlite':
+        store = OnboardingStateStore()
+        try:
+            store.sync_from_yaml(region, yaml_path)
+            return store.onboarded(region)
+        finally:
+            store.close()
+    return {client: set(envs or []) for client, envs in read_onboarded_yaml(yaml_path).items()}
+
+
+def record_onboarded(region, yaml_path, client_envs):
+    """ Add the onboarded client envs to the state and to config/<region>.yaml, safe against concurrent writers on this host. """
+    with file_lock(yaml_path):
+        if STATE_BACKEND == 'sqlite':
+            store = OnboardingStateStore()
+            try:
+                store.sync_from_yaml(region, yaml_path)
+                store.upsert(region, client_envs)
+                store.export_yaml(region, yaml_path)
+            finally:
+                store.close()
+            return
+
+        existing_data = read_onboarded_yaml(yaml_path)
+        for client, envs in client_envs.items():
+            known = existing_data.setdefault(client, [])
+            seen = set(known)
+            for env in envs:
+                if env not in seen:
+                    known.append(env)
+                    seen.add(env)
+        write_yaml_atomic(yaml_path, existing_data)
@@ -0,0 +1,81 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class TaskGraphError(Exception):
+    def __init__(self, failures, skipped):
+        self.failures = failures
+        self.skipped = skipped
+        details = '; '.join(f"{name}: {error}" for name, error in failures.items())
+        super().__init__(f"{details} (skipped: {', '.join(skipped) or 'none'})")
+
+
+class TaskGraph:
+    """
+    Steps with explicit dependencies. Independent branches run at the same time, so the
+    total time is the one of the critical path instead of the sum of all steps.
+
+    Each task is called with the results of the tasks completed so far ({name: result}).
+    """
+
+    def __init__(self, name=''):
+        self.name = name
+        self.tasks = {}
+
+    def add(self, name, func, deps=()):
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError(f"Task '{name}' depends on unknown task '{dep}'")
+        self.tasks[name] = (func, tuple(deps))
+        return name
+
+    def stages(self):
+        """ Tasks grouped in waves: every task of a stage only depends on earlier stages. """
+        depth = {}
+        for name, (_, deps) in self.tasks.items():
+            # Dependencies are always added before their dependents, so they already have a depth
+            depth[name] = max((depth[dep] + 1 for dep in deps), default=0)
+        stages = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+        for name, level in depth.items():
+            stages[level].append(name)
+        return stages
+
+    def describe(self):
+        lines = [f"{self.name}:"]
+        for level, names in enumerate(self.stages()):
+            lines.append(f"  stage {level}:")
+            for name in names:
+                deps = self.tasks[name][1]
+                lines.append(f"    {name}" + (f"  <- {', '.join(deps)}" if deps else ""))
+        return '\n'.join(lines)
+
+    def run(self, max_workers=4):
+        """ Run every task as soon as its dependencies succeeded. Raises TaskGraphError if any task failed. """
+        results, failures, skipped = {}, {}, []
+        pending = dict(self.tasks)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{self.name or 'task'}") as executor:
+            while pending or running:
+                for name, (func, deps) in list(pending.items()):
+                    if any(dep in failures or dep in skipped for dep in deps):
+                        skipped.append(name)
+                        del pending[name]
+                    elif all(dep in results for dep in deps):
+                        running[executor.submit(func, dict(results))] = name
+                        del pending[name]
+
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        logging.error(f"Task '{name}' of {self.name} failed: {e}")
+                        failures[name] = e
+
+        if failures:
+            raise TaskGraphError(failures, skipped)
+        return results
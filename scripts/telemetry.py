@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+class Tracer:
+    """ Collects timing spans per client/env/step and AWS call counters per operation for one run. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.monotonic()
+        self.spans = []
+        self.api_calls = defaultdict(lambda: {'calls': 0, 'retries': 0, 'errors': 0, 'seconds': 0.0})
+
+    @contextmanager
+    def span(self, step, client=None, env=None, **attributes):
+        start = time.monotonic()
+        status = 'ok'
+        try:
+            yield
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            record = {
+                'step': step,
+                'client': client,
+                'env': env,
+                'start': round(start - self._start, 3),
+                'seconds': round(time.monotonic() - start, 3),
+                'status': status,
+                'thread': threading.current_thread().name,
+            }
+            record.update(attributes)
+            with self._lock:
+                self.spans.append(record)
+
+    def record_api_call(self, service, operation, seconds, retries=0, error=None):
+        with self._lock:
+            counters = self.api_calls[f"{service}.{operation}"]
+            counters['calls'] += 1
+            counters['retries'] += retries
+            counters['seconds'] += seconds
+            if error:
+                counters['errors'] += 1
+
+    def step_summary(self):
+        summary = {}
+        for span in self.spans:
+            step = summary.setdefault(span['step'], {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'errors': 0})
+            step['count'] += 1
+            step['seconds'] = round(step['seconds'] + span['seconds'], 3)
+            step['max_seconds'] = max(step['max_seconds'], span['seconds'])
+            step['errors'] += span['status'] != 'ok'
+        return summary
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at.isoformat(),
+                'wall_seconds': round(time.monotonic() - self._start, 3),
+                'steps': self.step_summary(),
+                'api_calls': {op: dict(c, seconds=round(c['seconds'], 3)) for op, c in sorted(self.api_calls.items())},
+                'spans': list(self.spans),
+            }
+
+
+tracer = Tracer()
+span = tracer.span
+record_api_call = tracer.record_api_call
+
+
+def retry_attempts(response):
+    """ Number of retries botocore did for a call, from a response or a ClientError response. """
+    if not isinstance(response, dict):
+        return 0
+    return response.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+
+
+def default_trace_path(region):
+    return os.environ.get("ONBOARDING_TRACE_PATH", f"./onboarding-trace-{region}.json")
+
+
+def write_trace(path, **metadata):
+    """
+    Write the run trace as JSON. Traces of the scripts run in the same job (main.py, then
+    update_config.py) are merged into the same file.
+    """
+    trace = tracer.to_dict()
+    trace.update(metadata)
+    runs = []
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as file:
+                runs = json.load(file).get('runs', [])
+        except (OSError, ValueError) as e:
+            logging.warning(f"Overwriting unreadable trace {path}: {e}")
+    runs.append(trace)
+    with open(path, 'w') as file:
+        json.dump({'runs': runs}, file, indent=2)
+    logging.info(f"Trace written to {path}")
@@ -0,0 +1,105 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from telemetry import record_api_call, retry_attempts
+
+# Max number of in-flight calls per service, shared by every onboarding worker.
+# Override with ONBOARD_<SERVICE>_CONCURRENCY (e.g. ONBOARD_EFS_CONCURRENCY=2)
+DEFAULT_SERVICE_LIMITS = {
+    'efs': 4,
+    'secretsmanager': 4,
+    'postgres': 2,
+}
+
+# Client methods that only build helper objects and never hit the AWS API
+PASSTHROUGH_METHODS = {'get_paginator', 'get_waiter', 'can_paginate', 'close'}
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def service_limit(service):
+    """ Return the configured concurrency limit for a service. """
+    env_name = f"ONBOARD_{service.upper()}_CONCURRENCY"
+    return max(1, int(os.environ.get(env_name, DEFAULT_SERVICE_LIMITS.get(service, 4))))
+
+
+def _get_semaphore(service):
+    with _semaphores_lock:
+        if service not in _semaphores:
+            limit = service_limit(service)
+            logging.info(f"Limiting concurrent '{service}' calls to {limit}")
+            _semaphores[service] = threading.BoundedSemaphore(limit)
+        return _semaphores[service]
+
+
+@contextmanager
+def service_slot(service):
+    """ Hold one of the service slots for the duration of the block. """
+    semaphore = _get_semaphore(service)
+    with semaphore:
+        yield
+
+
+class ThrottledClient:
+    """
+    Wraps a boto3 client so every API call takes a slot of its service limit
+    and is counted (with its retries) in the run telemetry.
+    """
+
+    def __init__(self, client, service):
+        self._client = client
+        self._service = service
+
+    def _call(self, operation, func, *args, **kwargs):
+        start = time.monotonic()
+        with service_slot(self._service):
+            try:
+                response = func(*args, **kwargs)
+            except Exception as e:
+                record_api_call(self._service, operation, time.monotonic() - start,
+                                retry_attempts(getattr(e, 'response', None)), error=e)
+                raise
+        record_api_call(self._service, operation, time.monotonic() - start, retry_attempts(response))
+        return response
+
+    def get_paginator(self, operation):
+        return ThrottledPaginator(self, operation, self._client.get_paginator(operation))
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name in PASSTHROUGH_METHODS:
+            return attr
+
+        def call(*args, **kwargs):
+            return self._call(name, attr, *args, **kwargs)
+        return call
+
+
+class ThrottledPaginator:
+    """ Paginator whose page requests go through the client throttling and telemetry. """
+
+    def __init__(self, client, operation, paginator):
+        # client is the ThrottledClient the paginator was created from
+        self._client = client
+        self._operation = operation
+        self._paginator = paginator
+
+    def paginate(self, **kwargs):
+        service = self._client._service
+        pages = iter(self._paginator.paginate(**kwargs))
+        while True:
+            start = time.monotonic()
+            with service_slot(service):
+                try:
+                    page = next(pages, None)
+                except Exception as e:
+                    record_api_call(service, self._operation, time.monotonic() - start,
+                                    retry_attempts(getattr(e, 'response', None)), error=e)
+                    raise
+            if page is None:
+                return
+            record_api_call(service, self._operation, time.monotonic() - start, retry_attempts(page))
+            yield page
@@ -0,0 +1,140 @@
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from botocore.exceptions import ClientError
+
+
+def describe_all_file_systems(efs_client):
+    """ Return every file system of the region, following NextMarker across pages. """
+    file_systems = []
+    paginator = efs_client.get_paginator('describe_file_systems')
+    for page in paginator.paginate():
+        file_systems.extend(page.get('FileSystems', []))
+    return file_systems
+
+
+class EfsStatusWaiter:
+    """
+    Shared waiter for EFS file systems and mount targets.
+
+    Every thread waiting on a resource registers it here; a single poller thread sweeps all
+    pending file systems with one paginated describe_file_systems call per tick and wakes the
+    waiters as soon as their resource changes state. The delay between ticks starts at
+    min_delay and backs off (with jitter) up to max_delay while nothing changes.
+    """
+
+    def __init__(self, efs_client, min_delay=1, max_delay=15, backoff=1.5, jitter=0.2):
+        self.efs_client = efs_client
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.jitter = jitter
+        self.sweep_listeners = []
+
+        self._cond = threading.Condition()
+        self._wakeup = threading.Event()
+        self._poller = None
+        self._fs_waiters = Counter()
+        self._mt_waiters = Counter()
+        self._fs_states = {}
+        self._mt_states = {}
+
+    def add_sweep_listener(self, listener):
+        """ Register a callable receiving the full FileSystems list of every sweep. """
+        self.sweep_listeners.append(listener)
+
+    def wait_for_file_system(self, file_system_id, state='available', timeout=300):
+        return self._wait(self._fs_waiters, file_system_id,
+                          lambda: self._fs_states.get(file_system_id) == state, timeout)
+
+    def wait_for_mount_targets(self, file_system_id, timeout=300):
+        """ Wait until the file system has mount targets and all of them are available. """
+        return self._wait(self._mt_waiters, file_system_id,
+                          lambda: self._mt_states.get(file_system_id) is True, timeout)
+
+    def _wait(self, waiters, file_system_id, is_done, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            waiters[file_system_id] += 1
+            try:
+                self._ensure_poller()
+                while not is_done():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                waiters[file_system_id] -= 1
+                if waiters[file_system_id] <= 0:
+                    del waiters[file_system_id]
+
+    def _ensure_poller(self):
+        """ Start the poller if needed, and make it sweep right away for the new waiter. Caller holds the lock. """
+        self._wakeup.set()
+        if self._poller is None:
+            self._poller = threading.Thread(target=self._poll_loop, name="efs-waiter", daemon=True)
+            self._poller.start()
+
+    def _poll_loop(self):
+        delay = self.min_delay
+        while True:
+            with self._cond:
+                fs_ids = set(self._fs_waiters)
+                mt_ids = set(self._mt_waiters)
+                if not fs_ids and not mt_ids:
+                    self._poller = None
+                    return
+
+            try:
+                changed = self._sweep(fs_ids, mt_ids)
+            except Exception as e:
+                logging.error(f"An error occurred while polling EFS status: {e}")
+                changed = False
+
+            if changed:
+                with self._cond:
+                    self._cond.notify_all()
+                delay = self.min_delay
+            else:
+                delay = min(delay * self.backoff, self.max_delay)
+
+            # A new waiter sets the event so it does not sit out the current backoff
+            woken = self._wakeup.wait(delay * random.uniform(1 - self.jitter, 1 + self.jitter))
+            self._wakeup.clear()
+            if woken:
+                delay = self.min_delay
+
+    def _sweep(self, fs_ids, mt_ids):
+        """ Refresh the state of every pending resource. Returns True if anything changed. """
+        changed = False
+        file_systems = describe_all_file_systems(self.efs_client)
+        states = {fs['FileSystemId']: fs.get('LifeCycleState') for fs in file_systems}
+        for listener in self.sweep_listeners:
+            listener(file_systems)
+
+        with self._cond:
+            for fs_id in fs_ids:
+                if self._fs_states.get(fs_id) != states.get(fs_id):
+                    self._fs_states[fs_id] = states.get(fs_id)
+                    changed = True
+
+        # describe_mount_targets only accepts one file system at a time, so only
+        # the file systems someone is actually waiting on are described.
+        for fs_id in mt_ids:
+            if states.get(fs_id) != 'available':
+                continue
+            try:
+                response = self.efs_client.describe_mount_targets(FileSystemId=fs_id)
+            except ClientError as e:
+                logging.error(f"An error occurred: {e}")
+                continue
+            mount_targets = response.get('MountTargets', [])
+            ready = bool(mount_targets) and all(mt['LifeCycleState'] == 'available' for mt in mount_targets)
+            with self._cond:
+                if self._mt_states.get(fs_id) != ready:
+                    self._mt_states[fs_id] = ready
+                    changed = True
+        return changed
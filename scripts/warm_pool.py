@@ -0,0 +1,200 @@
+import logging
+import os
+import time
+import uuid
+from botocore.exceptions import ClientError
+from regions import get_region_config
+from state_store import file_lock
+from telemetry import span
+from waiter import describe_all_file_systems
+
+# Number of spare file systems (encrypted, mount targets available, no client tags) kept per region
+WARM_POOL_SIZE = int(os.environ.get("EFS_WARM_POOL_SIZE", 0))
+# Time given to the tag writes of concurrent runners to become visible before a claim is decided
+SETTLE_DELAY = float(os.environ.get("EFS_WARM_POOL_SETTLE", 2))
+# Claims and pending members older than this were left behind by a runner that died
+STALE_AFTER = 1800
+# Attempts at taking a claimed file system out of the pool once the client tags are on it
+UNTAG_ATTEMPTS = 5
+
+POOL_TAG = 'dotcms.warm-pool'              # 'pending' while being built, 'available' once claimable
+CREATED_TAG = 'dotcms.warm-pool.created'
+CLAIM_TAG_PREFIX = 'dotcms.warm-pool.claim.'
+CLIENT_TAG = 'dotcms.client.name.short'    # written by a claim, a file system carrying it is never claimable again
+
+
+def tags_of(fs):
+    return {tag.get('Key'): tag.get('Value') for tag in fs.get('Tags', [])}
+
+
+def tag_time(value):
+    """ Timestamp stored in a pool tag, 0 (oldest possible) when it is missing or malformed. """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class EfsWarmPool:
+    """
+    Pool of pre-provisioned file systems of a region that create_efs claims instead of creating one.
+    Claims never wait for a refill: the pool is topped up by running this module after the onboarding.
+
+    EFS tags have no compare-and-set, so a claim adds a tag unique to the claimer
+    (dotcms.warm-pool.claim.<token> = time), waits for concurrent claims to settle and re-reads the tags:
+    the oldest live claim wins and the others move on to the next member. The same ordering
+    (oldest first) decides which file systems a refill keeps when several runners refill at once.
+    On one host, members are also picked and tagged under a file lock so local runners never race.
+    """
+
+    def __init__(self, efs_manager, size=WARM_POOL_SIZE, settle_delay=SETTLE_DELAY):
+        self.efs_manager = efs_manager
+        self.efs_client = efs_manager.efs_client
+        self.region = efs_manager.region
+        self.size = size
+        self.settle_delay = settle_delay
+        self._lock_name = f"efs-warm-pool-{self.region}"
+
+    def members(self, states=('pending', 'available')):
+        """ Pool file systems of the region, oldest first. """
+        members = [fs for fs in describe_all_file_systems(self.efs_client)
+                   if tags_of(fs).get(POOL_TAG) in states and CLIENT_TAG not in tags_of(fs)
+                   and fs.get('LifeCycleState') in ('creating', 'available')]
+        return sorted(members, key=lambda fs: (tag_time(tags_of(fs).get(CREATED_TAG)), fs['FileSystemId']))
+
+    def _tags(self, fs_id):
+        return tags_of(self.efs_client.list_tags_for_resource(ResourceId=fs_id))
+
+    def _live_claims(self, tags):
+        now = time.time()
+        return sorted((tag_time(value), key) for key, value in tags.items()
+                      if key.startswith(CLAIM_TAG_PREFIX) and now - tag_time(value) < STALE_AFTER)
+
+    def _stake_claim(self, skip):
+        """ Tag a claim on the first available member nobody is claiming. Returns (FileSystemId, claim tag key). """
+        expected_mount_targets = len(get_region_config(self.region).get('subnet_ids', []))
+        # The host lock only covers picking a member and tagging it, the settle wait runs outside of it
+        with file_lock(self._lock_name):
+            for fs in self.members(states=('available',)):
+                fs_id = fs['FileSystemId']
+                if (fs_id in skip or fs['LifeCycleState'] != 'available' or self._live_claims(tags_of(fs))
+                        or fs.get('NumberOfMountTargets', 0) < expected_mount_targets):
+                    continue
+                claim_key = CLAIM_TAG_PREFIX + uuid.uuid4().hex
+                skip.add(fs_id)
+                try:
+                    self.efs_client.tag_resource(ResourceId=fs_id, Tags=[{'Key': claim_key, 'Value': f"{time.time():.6f}"}])
+                except ClientError as e:
+                    logging.warning(f"Could not claim warm EFS {fs_id}: {e}")
+                    continue
+                return fs_id, claim_key
+        return None, None
+
+    def claim(self, tags):
+        """ Retag an available member with tags and return its FileSystemId, None if the pool is empty. """
+        tried = set()
+        while True:
+            fs_id, claim_key = self._stake_claim(tried)
+            if not fs_id:
+                return None
+            try:
+                time.sleep(self.settle_delay)
+                current = self._tags(fs_id)
+                claims = self._live_claims(current)
+                if current.get(POOL_TAG) != 'available' or not claims or claims[0][1] != claim_key:
+                    logging.info(f"Warm EFS {fs_id} was claimed by another runner")
+                    self._release(fs_id, claim_key)
+                    continue
+                self.efs_client.tag_resource(ResourceId=fs_id, Tags=tags)
+            except ClientError as e:
+                logging.warning(f"Could not claim warm EFS {fs_id}: {e}")
+                self._release(fs_id, claim_key)
+                continue
+            # The client tags are on it, this file system is ours whether or not it leaves the pool cleanly
+            self._leave_pool(fs_id, [POOL_TAG, CREATED_TAG] + [key for key in current if key.startswith(CLAIM_TAG_PREFIX)])
+            logging.info(f"Claimed warm EFS {fs_id}")
+            return fs_id
+
+    def _release(self, fs_id, claim_key):
+        """ Drop a claim that lost or failed, so it does not hold the member back until it goes stale. """
+        try:
+            self.efs_client.untag_resource(ResourceId=fs_id, TagKeys=[claim_key])
+        except ClientError as e:
+            logging.warning(f"Could not release the claim on warm EFS {fs_id}, it expires in {STALE_AFTER}s: {e}")
+
+    def _leave_pool(self, fs_id, tag_keys):
+        """ Remove the pool tags of a claimed file system, retrying: members() already skips it for its client tag. """
+        for attempt in range(UNTAG_ATTEMPTS):
+            try:
+                self.efs_client.untag_resource(ResourceId=fs_id, TagKeys=tag_keys)
+                return
+            except ClientError as e:
+                logging.warning(f"Could not remove the warm pool tags of EFS {fs_id} (attempt {attempt + 1}): {e}")
+                time.sleep(2 ** attempt)
+        logging.error(f"EFS {fs_id} keeps its warm pool tags {tag_keys}, remove them by hand")
+
+    def refill(self):
+        """ Top the pool up to size and finish members left pending by a runner that died. Returns the members made available. """
+        region_config = get_region_config(self.region)
+        subnet_ids = region_config.get('subnet_ids', [])
+        security_groups = region_config.get('security_groups', [])
+        with file_lock(self._lock_name):
+            members = self.members()
+            created = []
+            for _ in range(max(0, self.size - len(members))):
+                response = self.efs_client.create_file_system(
+                    PerformanceMode='generalPurpose',
+                    ThroughputMode='bursting',
+                    Encrypted=True,
+                    Tags=[{'Key': POOL_TAG, 'Value': 'pending'}, {'Key': CREATED_TAG, 'Value': f"{time.time():.6f}"}]
+                )
+                created.append(response['FileSystemId'])
+        stale = [fs['FileSystemId'] for fs in members if tags_of(fs).get(POOL_TAG) == 'pending'
+                 and time.time() - tag_time(tags_of(fs).get(CREATED_TAG)) > STALE_AFTER]
+        if not created and not stale:
+            return []
+        logging.info(f"Refilling the EFS warm pool of {self.region}: {len(created)} new, {len(stale)} stale")
+
+        # Runners refilling at the same time may overshoot: everyone keeps the same oldest `size` members
+        time.sleep(self.settle_delay)
+        keep = {fs['FileSystemId'] for fs in self.members()[:self.size]}
+
+        ready = []
+        for fs_id in created + stale:
+            if not self.efs_manager.wait_for_efs_available(fs_id):
+                logging.warning(f"Warm EFS {fs_id} did not become available")
+                continue
+            if fs_id in created and fs_id not in keep:
+                logging.info(f"Warm pool of {self.region} is full, deleting surplus EFS {fs_id}")
+                self.efs_client.delete_file_system(FileSystemId=fs_id)
+                continue
+            for subnet_id in subnet_ids:
+                if not self.efs_manager.mount_target_exists(fs_id, subnet_id):
+                    self.efs_manager.create_mount_target(fs_id, subnet_id, security_groups)
+            if self.efs_manager.wait_for_mount_target_availability(fs_id):
+                self.efs_client.tag_resource(ResourceId=fs_id, Tags=[{'Key': POOL_TAG, 'Value': 'available'}])
+                ready.append(fs_id)
+        logging.info(f"Warm EFS ready in {self.region}: {ready}")
+        return ready
+
+
+if __name__ == '__main__':
+    # Usage: AWS_REGION=<region> EFS_WARM_POOL_SIZE=<n> python3 scripts/warm_pool.py
+    # Fills the warm pool of the region and prints its members (the workflow runs it after update_config)
+    import sys
+    from efs import AwsEfsManager
+    from telemetry import write_trace, default_trace_path
+
+    logging.basicConfig(level=logging.INFO)
+    region = os.environ.get("AWS_REGION")
+    pool = EfsWarmPool(AwsEfsManager(region))
+    try:
+        with span('warm_pool_refill', region=region):
+            pool.refill()
+        for fs in pool.members():
+            print(fs['FileSystemId'], tags_of(fs).get(POOL_TAG), fs.get('NumberOfMountTargets', 0))
+    except Exception as e:
+        logging.error(f"EFS warm pool refill failed: {e}")
+        sys.exit(1)
+    finally:
+        write_trace(default_trace_path(region), script='warm_pool.py', region=region)